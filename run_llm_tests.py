@@ -4,9 +4,10 @@ Test runner for LLM inference tests using pytest.
 """
 
 import sys
-import subprocess
 from pathlib import Path
 
+import pytest
+
 
 def run_llm_tests():
     """Run LLM inference tests using pytest."""
@@ -35,8 +36,7 @@ def run_llm_tests():
     print()
     
     # Run pytest with specific options
-    cmd = [
-        sys.executable, "-m", "pytest",
+    args = [
         "tests/test_llm_inference.py",
         "-v",
         "-s",
@@ -47,12 +47,12 @@ def run_llm_tests():
         "--color=yes"
     ]
     
-    print(f"Running: {' '.join(cmd)}")
+    print(f"Running: pytest {' '.join(args)}")
     print()
     
+    # Run pytest in-process to avoid interpreter startup and re-imports
     try:
-        result = subprocess.run(cmd, check=False)
-        return result.returncode
+        return int(pytest.main(args))
     except KeyboardInterrupt:
         print("\n⚠️  Tests interrupted by user")
         return 1
@@ -66,8 +66,7 @@ def run_unit_tests():
     print("🧪 Running Unit Tests")
     print("=" * 40)
     
-    cmd = [
-        sys.executable, "-m", "pytest",
+    args = [
         "tests/test_llm_inference.py",
         "-v",
         "-s",
@@ -78,12 +77,12 @@ def run_unit_tests():
         "--color=yes"
     ]
     
-    print(f"Running: {' '.join(cmd)}")
+    print(f"Running: pytest {' '.join(args)}")
     print()
     
+    # Run pytest in-process to avoid interpreter startup and re-imports
     try:
-        result = subprocess.run(cmd, check=False)
-        return result.returncode
+        return int(pytest.main(args))
     except KeyboardInterrupt:
         print("\n⚠️  Tests interrupted by user")
         return 1
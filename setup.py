@@ -7,16 +7,19 @@ setup(
     package_dir={"": "src"},
     install_requires=[
         # Add your dependencies here
+        "PyYAML>=6.0",
+        "orjson>=3.9.0",
     ],
     extras_require={
         "dev": [
             "pytest>=7.0.0",
+            "pytest-xdist>=3.0.0",
             "black>=22.0.0",
             "flake8>=5.0.0",
             "mypy>=1.0.0",
         ],
     },
-    python_requires=">=3.8",
+    python_requires=">=3.9",
     author="Your Name",
     author_email="your.email@example.com",
     description="A Python project with clean structure",
@@ -27,7 +30,6 @@ setup(
         "Intended Audience :: Developers",
         "License :: OSI Approved :: MIT License",
         "Programming Language :: Python :: 3",
-        "Programming Language :: Python :: 3.8",
         "Programming Language :: Python :: 3.9",
         "Programming Language :: Python :: 3.10",
         "Programming Language :: Python :: 3.11",
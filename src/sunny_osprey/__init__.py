@@ -7,6 +7,14 @@ __author__ = "Your Name"
 __email__ = "your.email@example.com"
 
 from .main import run_mqtt_processor
-from .mqtt_processor import FrigateEventProcessor
 
 __all__ = ["run_mqtt_processor", "FrigateEventProcessor"]
+
+
+def __getattr__(name):
+    # Resolved on first use so importing a submodule (e.g. sunny_osprey.config)
+    # doesn't pull in paho-mqtt, requests and the Telegram client
+    if name == "FrigateEventProcessor":
+        from .mqtt_processor import FrigateEventProcessor
+        return FrigateEventProcessor
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -2,16 +2,110 @@
 Grafana Alert Module for Security Camera Analysis
 """
 
-import json
 import logging
 import os
-import requests
-from typing import Dict, Any, Optional
-from datetime import datetime, timezone
-import asyncio
-from telegram import Bot
+import threading
+from functools import lru_cache
+from typing import Dict, Any, List, NamedTuple, Optional, Tuple
 from .telegram_alert import TelegramAlert
 from .grafana_irm_alert import GrafanaIRMAlert
+from .incident import Incident
+
+_LOG = logging.getLogger(__name__)
+
+# Description prefixes for suspicious vs. normal activity
+_SUSPICIOUS_PREFIX = "🚨 SECURITY ALERT 🚨\n"
+_NORMAL_PREFIX = "🏃 NORMAL ACTIVITY 🏃\n"
+
+# String values the LLM uses to signal a positive detection
+_TRUTHY = frozenset({"yes", "true", "1", "y"})
+
+
+@lru_cache(maxsize=16)
+def _str_truthy(value: str) -> bool:
+    """Normalize a string flag such as "Yes"/"no" to a boolean (memoized)."""
+    return value.lower() in _TRUTHY
+
+
+# Per-type normalization of the suspicious flag (bool, "yes"/"no" strings, 0/1 numbers)
+_TRUTHY_DISPATCH = {
+    bool: bool,
+    str: _str_truthy,
+    int: bool,
+    float: bool,
+}
+
+
+class _EnvSnapshot(NamedTuple):
+    backend: str
+    video_clip_base_url: Optional[str]
+
+
+@lru_cache(maxsize=1)
+def _env_snapshot() -> _EnvSnapshot:
+    """
+    Read alert-related environment variables once per process.
+    
+    Changes to ALERT_BACKEND or VIDEO_CLIP_BASE_URL require a restart.
+    """
+    return _EnvSnapshot(
+        backend=os.getenv('ALERT_BACKEND', 'telegram').lower(),
+        video_clip_base_url=os.getenv('VIDEO_CLIP_BASE_URL')
+    )
+
+
+# Alert backends keyed by (backend name, backend config), shared across AlertManagers.
+# Each entry is [backend, owner count]; a backend is closed when its last owner releases it
+_backend_cache: Dict[Tuple[str, frozenset], List[Any]] = {}
+_backend_cache_lock = threading.Lock()
+
+
+def _get_alert_backend(backend: str, backend_config: Dict[str, Any]) -> Tuple[Any, Optional[Tuple[str, frozenset]]]:
+    """
+    Return a shared alert backend instance for the given name and config.
+    
+    Args:
+        backend: Backend name ("telegram" selects Telegram, anything else Grafana IRM)
+        backend_config: Backend-specific configuration dictionary
+        
+    Returns:
+        Tuple of (TelegramAlert or GrafanaIRMAlert instance, cache key to pass to
+        _release_alert_backend, or None for an unshared instance)
+    """
+    backend_class = TelegramAlert if backend == 'telegram' else GrafanaIRMAlert
+    try:
+        key = (backend, frozenset(backend_config.items()))
+    except TypeError:
+        # Unhashable config values - build a dedicated instance
+        return backend_class(backend_config), None
+    
+    with _backend_cache_lock:
+        entry = _backend_cache.get(key)
+        if entry is None:
+            entry = _backend_cache[key] = [backend_class(backend_config), 0]
+        entry[1] += 1
+        return entry[0], key
+
+
+def _release_alert_backend(key: Tuple[str, frozenset]) -> bool:
+    """
+    Drop one owner of a shared alert backend.
+    
+    Args:
+        key: Cache key returned by _get_alert_backend
+        
+    Returns:
+        True if this was the last owner and the backend should be closed
+    """
+    with _backend_cache_lock:
+        entry = _backend_cache.get(key)
+        if entry is None:
+            return False
+        entry[1] -= 1
+        if entry[1] > 0:
+            return False
+        del _backend_cache[key]
+        return True
 
 
 def is_suspicious_activity_detected(llm_result: Dict[str, Any]) -> bool:
@@ -28,87 +122,94 @@ def is_suspicious_activity_detected(llm_result: Dict[str, Any]) -> bool:
         bool: True if suspicious activity detected, False otherwise
     """
     # Check for new field name first, then fall back to old field name
-    value = llm_result.get('suspicious') or llm_result.get('is_unusual_or_suspicious_activity_detected')
+    value = llm_result['suspicious'] if 'suspicious' in llm_result else llm_result.get('is_unusual_or_suspicious_activity_detected')
     
     # Handle None/empty values
     if value is None:
         return False
     
-    # Handle boolean values
-    if isinstance(value, bool):
-        return value
-    
-    # Handle string values (case-insensitive)
-    if isinstance(value, str):
-        return value.lower() in ["yes", "true", "1"]
-    
-    # Handle numeric values
-    if isinstance(value, (int, float)):
-        return bool(value)
-    
-    # Default to False for any other type
-    return False
+    # Dispatch on the exact type; anything else (lists, dicts, ...) is False
+    normalize = _TRUTHY_DISPATCH.get(type(value))
+    return normalize(value) if normalize else False
 
 
 class AlertManager:
     """Routes alerts to the appropriate backend (Telegram or Grafana IRM)."""
     def __init__(self, config: Dict[str, Any] = None):
         self.config = config or {}
-        self.backend = os.getenv('ALERT_BACKEND', 'telegram').lower()
+        env = _env_snapshot()
+        self.backend = env.backend
         
         # Get alert configurations
         alerts_config = self.config.get('alerts', {})
         telegram_config = alerts_config.get('telegram', {})
         grafana_config = alerts_config.get('grafana', {})
         
-        if self.backend == 'telegram':
-            self.alert_backend = TelegramAlert(telegram_config)
-        else:
-            self.alert_backend = GrafanaIRMAlert(grafana_config)
-        self.video_clip_base_url = os.getenv('VIDEO_CLIP_BASE_URL')
+        backend_config = telegram_config if self.backend == 'telegram' else grafana_config
+        self.alert_backend, self._backend_key = _get_alert_backend(self.backend, backend_config)
+        self._closed = False
+        self.video_clip_base_url = env.video_clip_base_url
+        # Escape literal '%' in the base URL so it survives %-formatting
+        self._video_url_template = (
+            self.video_clip_base_url.replace('%', '%%') + "?event_id=%s" if self.video_clip_base_url else None
+        )
 
-    def _prepare_incident_data(self, event_id: str, llm_result: Dict[str, Any]) -> Dict[str, Any]:
-        video_url = f"{self.video_clip_base_url}?event_id={event_id}" if self.video_clip_base_url else ""
-        now_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    def _prepare_incident_data(self, event_id: str, llm_result: Dict[str, Any],
+                               is_suspicious: Optional[bool] = None,
+                               video_path: Optional[str] = None) -> Incident:
+        video_url = self._video_url_template % event_id if self._video_url_template else ""
         description = llm_result.get('description', 'No description available')
         
-        # Check if this is a suspicious activity using the helper function
-        is_suspicious = is_suspicious_activity_detected(llm_result)
+        # Check if this is a suspicious activity using the helper function (unless the caller already did)
+        if is_suspicious is None:
+            is_suspicious = is_suspicious_activity_detected(llm_result)
         
         # Different decorations based on suspicious status
-        if is_suspicious:
-            start_art = "🚨 SECURITY ALERT 🚨"
-            decorated_description = f"{start_art}\n{description}"
-        else:
-            start_art = "🏃 NORMAL ACTIVITY 🏃"
-            decorated_description = f"{start_art}\n{description}"
+        prefix = _SUSPICIOUS_PREFIX if is_suspicious else _NORMAL_PREFIX
+        decorated_description = f"{prefix}{description}"
+        # Length-bounded variant for incident titles, computed once here for all backends
+        title_description = (
+            decorated_description if len(decorated_description) <= 100 else decorated_description[:97] + "..."
+        )
         
         decorated_video_url = f"[Video Clip] {video_url}" if video_url else ""
-        incident_data = {
-            'event_id': event_id,
-            'description': decorated_description,
-            'video_url': decorated_video_url,
-            'llm_result': llm_result,
-            'is_suspicious': is_suspicious
-        }
-        return incident_data
-
-    def send_incident(self, event_id: str, llm_result: dict) -> bool:
-        incident_data = self._prepare_incident_data(event_id, llm_result)
-        
+        return Incident(
+            event_id=event_id,
+            description=decorated_description,
+            title_description=title_description,
+            video_url=decorated_video_url,
+            is_suspicious=is_suspicious,
+            llm_result=llm_result,
+            video_path=video_path if video_path is not None else llm_result.get('video_path')
+        )
+
+    def close(self):
+        """Release resources held by the alert backend (connections, threads)."""
+        if self._closed:
+            return
+        self._closed = True
+        # Shared backends stay open while another AlertManager still uses them
+        if self._backend_key is not None and not _release_alert_backend(self._backend_key):
+            return
+        close = getattr(self.alert_backend, 'close', None)
+        if close is not None:
+            close()
+
+    def send_incident(self, event_id: str, llm_result: dict, video_path: Optional[str] = None) -> bool:
         # Check if we should send this incident based on configuration
         send_all_activities = self.config.get('send_all_activities', False)
-        is_suspicious = incident_data.get('is_suspicious', False)
+        is_suspicious = is_suspicious_activity_detected(llm_result)
         
         # Only send if it's suspicious OR if send_all_activities is enabled
         if not is_suspicious and not send_all_activities:
-            logging.getLogger(__name__).info(f"Normal activity skipped for event {event_id} (send_all_activities: {send_all_activities})")
+            _LOG.info("Normal activity skipped for event %s (send_all_activities: %s)", event_id, send_all_activities)
             return True  # Return True to indicate "successfully handled" (by skipping)
         
         # Log what we're actually doing
         if is_suspicious:
-            logging.getLogger(__name__).info(f"Sending suspicious activity alert for event {event_id}")
+            _LOG.info("Sending suspicious activity alert for event %s", event_id)
         else:
-            logging.getLogger(__name__).info(f"Sending normal activity notification for event {event_id} (send_all_activities: {send_all_activities})")
+            _LOG.info("Sending normal activity notification for event %s (send_all_activities: %s)", event_id, send_all_activities)
         
-        return self.alert_backend.send_incident(incident_data) 
\ No newline at end of file
+        incident = self._prepare_incident_data(event_id, llm_result, is_suspicious, video_path)
+        return self.alert_backend.send_incident(incident) 
\ No newline at end of file
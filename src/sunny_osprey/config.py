@@ -2,12 +2,36 @@
 Configuration management for Sunny Osprey.
 """
 
+import copy
 import os
 import yaml
+from functools import lru_cache
 from typing import Dict, Any, List, Optional
 import logging
 from dotenv import load_dotenv
 
+# Prefer the libyaml C loader, fall back to the pure-Python one
+try:
+    from yaml import CSafeLoader as _YAMLLoader
+except ImportError:
+    from yaml import SafeLoader as _YAMLLoader
+
+
+@lru_cache(maxsize=8)
+def _parse_yaml_cached(path: str, mtime_ns: int) -> Dict[str, Any]:
+    """
+    Parse a YAML file, memoized on (path, mtime) so edits invalidate the cache.
+    
+    Args:
+        path: Absolute path to the YAML file
+        mtime_ns: Modification time of the file in nanoseconds
+        
+    Returns:
+        Parsed configuration dictionary
+    """
+    with open(path, 'r') as f:
+        return yaml.load(f, Loader=_YAMLLoader) or {}
+
 
 class SunnyOspreyConfig:
     """Configuration manager for Sunny Osprey."""
@@ -24,23 +48,54 @@ class SunnyOspreyConfig:
         # Load .env file if it exists
         self._load_env_file()
         
-        self.config = self._load_config()
+        self._apply(self._load_config())
+    
+    @classmethod
+    def from_mapping(cls, config_data: Dict[str, Any]) -> "SunnyOspreyConfig":
+        """
+        Build a configuration from a dictionary instead of a YAML file.
+        
+        No file or .env is read, and reload() leaves the result unchanged.
+        
+        Args:
+            config_data: Configuration dictionary with the same layout as the YAML file
+            
+        Returns:
+            Configuration instance
+        """
+        instance = cls.__new__(cls)
+        instance.config_path = None
+        instance._apply(copy.deepcopy(config_data))
+        return instance
+    
+    def _apply(self, config: Dict[str, Any]):
+        """Install a loaded configuration dictionary and derived state."""
+        self.config = config
+        self._enabled_cameras = self._build_camera_filter()
         self._setup_logging()
     
+    @staticmethod
+    @lru_cache(maxsize=4)
+    def _resolve_env_path(config_dir: str) -> Optional[str]:
+        """
+        Find the first existing .env file (memoized per config directory).
+        
+        Args:
+            config_dir: Directory containing the configuration file
+            
+        Returns:
+            Path to the .env file, or None if none exists
+        """
+        # Try to load .env file from current directory or config directory
+        env_paths = ('.env', os.path.join(config_dir, '.env'), '/app/.env')
+        return next(filter(os.path.exists, env_paths), None)
+    
     def _load_env_file(self):
         """Load environment variables from .env file."""
-        # Try to load .env file from current directory or config directory
-        env_paths = [
-            '.env',
-            os.path.join(os.path.dirname(self.config_path), '.env'),
-            '/app/.env'
-        ]
-        
-        for env_path in env_paths:
-            if os.path.exists(env_path):
-                load_dotenv(env_path)
-                print(f"✅ Loaded environment variables from {env_path}")
-                break
+        env_path = self._resolve_env_path(os.path.dirname(self.config_path))
+        if env_path:
+            load_dotenv(env_path)
+            print(f"✅ Loaded environment variables from {env_path}")
         else:
             print("⚠️  No .env file found, using system environment variables")
     
@@ -61,10 +116,11 @@ class SunnyOspreyConfig:
         """Load configuration from YAML file."""
         try:
             if os.path.exists(self.config_path):
-                with open(self.config_path, 'r') as f:
-                    config = yaml.safe_load(f)
+                path = os.path.abspath(self.config_path)
+                config = _parse_yaml_cached(path, os.stat(path).st_mtime_ns)
                 print(f"✅ Loaded configuration from {self.config_path}")
-                return config or {}
+                # Copy so callers can't mutate the cached result
+                return copy.deepcopy(config)
             else:
                 print(f"⚠️  Configuration file not found at {self.config_path}, using defaults")
                 return self._get_default_config()
@@ -147,6 +203,11 @@ class SunnyOspreyConfig:
         """Get alerts configuration."""
         return self.config.get('alerts', {})
     
+    def _build_camera_filter(self) -> Optional[frozenset]:
+        """Build the enabled camera set, or None if all cameras should be processed."""
+        enabled_cameras = self.get_camera_config().get('enabled_cameras', [])
+        return frozenset(enabled_cameras) if enabled_cameras else None
+    
     def should_process_camera(self, camera_name: str) -> bool:
         """
         Check if events from a specific camera should be processed.
@@ -157,14 +218,8 @@ class SunnyOspreyConfig:
         Returns:
             True if camera should be processed, False otherwise
         """
-        enabled_cameras = self.get_camera_config().get('enabled_cameras', [])
-        
-        # If no cameras are specified, process all cameras
-        if not enabled_cameras:
-            return True
-        
-        # Check if camera is in the enabled list
-        return camera_name in enabled_cameras
+        # If no cameras are specified, process all cameras; otherwise O(1) set lookup
+        return self._enabled_cameras is None or camera_name in self._enabled_cameras
     
     def should_skip_event(self, event_data: Dict[str, Any]) -> bool:
         """
@@ -200,7 +255,9 @@ class SunnyOspreyConfig:
         return self.get_llm_config().get('prompt_file', '/app/prompt.txt')
     
     def reload(self):
-        """Reload configuration from file."""
-        self.config = self._load_config()
-        self._setup_logging()
+        """Reload configuration from file (no-op for configurations built by from_mapping)."""
+        if self.config_path is None:
+            print("⚠️  Configuration was not loaded from a file, nothing to reload")
+            return
+        self._apply(self._load_config())
         print("✅ Configuration reloaded") 
\ No newline at end of file
@@ -1,17 +1,46 @@
-import os
-import json
 import logging
-import requests
-from typing import Dict, Any
-from datetime import datetime, timezone
+import queue
+import threading
+import orjson
+import urllib3
+from urllib3.util.retry import Retry
+from typing import Dict, Any, Optional
+from .incident import Incident
+
+_LOG = logging.getLogger(__name__)
+
+# Queued by close() to stop the background sender once earlier incidents are posted
+_STOP = object()
 
 class GrafanaIRMAlert:
     def __init__(self, config: Dict[str, Any] = None):
         self.config = config or {}
         self.url = self.config.get('url', '')
         self.api_key = self.config.get('api_key', '')
-        self.logger = logging.getLogger(__name__)
+        self.logger = _LOG
         self.enabled = self._validate_config()
+        # url and api_key never change, so build the endpoint and headers once
+        self._incident_url = f"{self.url}/api/plugins/grafana-irm-app/resources/api/v1/IncidentsService.CreateIncident"
+        self._headers = self._get_auth_headers()
+        self._http = self._create_pool_manager()
+        # With async_send, incidents are posted from a background worker and
+        # send_incident reports success once queued rather than once Grafana accepts them
+        self.async_send = self.config.get('async_send', False)
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=256)
+        self._worker: Optional[threading.Thread] = None
+        self._worker_lock = threading.Lock()
+        self._closed = False
+
+    def _create_pool_manager(self) -> urllib3.PoolManager:
+        # Keep-alive connection pool so consecutive incidents reuse the TCP/TLS connection;
+        # plain urllib3 avoids the per-request overhead of the requests wrapper.
+        # POST is not idempotent, so only failed connects (request never sent) are
+        # retried; a 5xx response may still have created the incident
+        return urllib3.PoolManager(
+            num_pools=2,
+            maxsize=8,
+            retries=Retry(total=2, backoff_factor=0.3)
+        )
 
     def _validate_config(self):
         if not self.url or not self.api_key:
@@ -26,66 +55,113 @@ class GrafanaIRMAlert:
             'Content-Type': 'application/json'
         }
 
-    def _prepare_grafana_payload(self, incident_data: Dict[str, Any]) -> Dict[str, Any]:
-        # Use incident_data fields
-        llm_description = incident_data['description']
-        if len(llm_description) > 100:
-            llm_description = llm_description[:97] + "..."
+    def _prepare_grafana_payload(self, incident: Incident) -> Dict[str, Any]:
+        # title_description is pre-truncated by AlertManager
+        llm_description = incident.title_description
         
-        is_suspicious = incident_data.get('is_suspicious', False)
-        if is_suspicious:
-            enhanced_title = f"Security Alert: {llm_description} - Event {incident_data['event_id']}"
+        if incident.is_suspicious:
+            enhanced_title = f"Security Alert: {llm_description} - Event {incident.event_id}"
             severity = 'critical'
             room_prefix = 'security-alert'
         else:
-            enhanced_title = f"NORMAL ACTIVITY: {llm_description} - Event {incident_data['event_id']}"
+            enhanced_title = f"NORMAL ACTIVITY: {llm_description} - Event {incident.event_id}"
             severity = 'info'
             room_prefix = 'normal-activity'
         
         payload = {
             'title': enhanced_title,
-            'description': incident_data['description'],
+            'description': incident.description,
             'severity': severity,
             'status': 'active',
             'isDrill': False,
             'roomPrefix': room_prefix,
-            'attachCaption': incident_data['description'],
-            'attachURL': incident_data['video_url']
+            'attachCaption': incident.description,
+            'attachURL': incident.video_url
         }
         return payload
 
     def _create_irm_incident(self, payload: Dict[str, Any]) -> bool:
         try:
-            # Construct the full URL for creating incidents
-            incident_url = f"{self.url}/api/plugins/grafana-irm-app/resources/api/v1/IncidentsService.CreateIncident"
-            headers = self._get_auth_headers()
-            response = requests.post(incident_url, json=payload, headers=headers, timeout=10)
-            if response.status_code in [200, 201]:
-                incident_id = response.json().get('id', 'unknown')
-                self.logger.info(f"Incident created in Grafana IRM successfully with ID: {incident_id}")
+            response = self._http.request(
+                'POST',
+                self._incident_url,
+                body=orjson.dumps(payload),
+                headers=self._headers,
+                timeout=urllib3.Timeout(connect=3, read=7)
+            )
+            if response.status in (200, 201):
+                incident_id = orjson.loads(response.data).get('id', 'unknown')
+                self.logger.info("Incident created in Grafana IRM successfully with ID: %s", incident_id)
                 return True
             else:
-                self.logger.warning(f"Failed to create incident: {response.status_code} - {response.text}")
+                # Only decode the response body if the warning will actually be emitted
+                if self.logger.isEnabledFor(logging.WARNING):
+                    response_text = response.data.decode('utf-8', errors='replace')
+                    self.logger.warning("Failed to create incident: %s - %s", response.status, response_text)
                 return False
         except Exception as e:
-            self.logger.error(f"Error creating IRM incident: {e}")
+            self.logger.error("Error creating IRM incident: %s", e)
+            return False
+
+    def _ensure_worker(self):
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._drain_queue, name="grafana-irm-sender", daemon=True)
+                self._worker.start()
+
+    def _drain_queue(self):
+        while True:
+            payload = self._queue.get()
+            try:
+                if payload is _STOP:
+                    return
+                self._create_irm_incident(payload)
+            finally:
+                self._queue.task_done()
+
+    def close(self, timeout: float = 30):
+        """Post the incidents still queued, then stop the background sender."""
+        with self._worker_lock:
+            self._closed = True
+            worker = self._worker
+        if worker is None or not worker.is_alive():
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        worker.join(timeout)
+        if worker.is_alive():
+            self.logger.warning("Grafana IRM sender did not finish, %s incident(s) not posted", self._queue.qsize())
+
+    def _enqueue_irm_incident(self, payload: Dict[str, Any]) -> bool:
+        if self._closed:
+            # Background sender is gone; post inline instead of dropping the incident
+            return self._create_irm_incident(payload)
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(payload)
+            return True
+        except queue.Full:
+            self.logger.warning("Grafana IRM send queue is full, dropping incident")
             return False
 
-    def send_incident(self, incident_data: Dict[str, Any]) -> bool:
+    def send_incident(self, incident: Incident) -> bool:
         if not self.enabled:
             self.logger.warning("Grafana IRM incidents are disabled due to missing configuration")
             return False
         try:
-            is_suspicious = incident_data.get('is_suspicious', False)
-            event_id = incident_data.get('event_id')
+            event_id = incident.event_id
             
-            if is_suspicious:
-                self.logger.info(f"Suspicious activity detected for event {event_id}, sending Grafana IRM alert")
+            if incident.is_suspicious:
+                self.logger.info("Suspicious activity detected for event %s, sending Grafana IRM alert", event_id)
             else:
-                self.logger.info(f"Normal activity detected for event {event_id}, sending Grafana IRM notification")
+                self.logger.info("Normal activity detected for event %s, sending Grafana IRM notification", event_id)
             
-            payload = self._prepare_grafana_payload(incident_data)
+            payload = self._prepare_grafana_payload(incident)
+            if self.async_send:
+                return self._enqueue_irm_incident(payload)
             return self._create_irm_incident(payload)
         except Exception as e:
-            self.logger.error(f"Error sending Grafana IRM incident for event {incident_data.get('event_id')}: {e}")
+            self.logger.error("Error sending Grafana IRM incident for event %s: %s", incident.event_id, e)
             return False 
\ No newline at end of file
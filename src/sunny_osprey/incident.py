@@ -0,0 +1,27 @@
+"""
+Incident record passed from the alert manager to alert backends
+"""
+
+from dataclasses import dataclass
+from typing import Dict, Any, Optional
+
+
+@dataclass
+class Incident:
+    """An analyzed Frigate event, ready to be sent by an alert backend."""
+    __slots__ = (
+        'event_id', 'description', 'title_description', 'video_url',
+        'is_suspicious', 'llm_result', 'video_path'
+    )
+
+    event_id: str
+    # Description decorated with the alert/normal prefix
+    description: str
+    # Decorated description truncated to 100 characters for incident titles
+    title_description: str
+    # "[Video Clip] <url>" link, or "" when no clip base URL is configured
+    video_url: str
+    is_suspicious: bool
+    llm_result: Dict[str, Any]
+    # Local clip file for backends that upload the video
+    video_path: Optional[str]
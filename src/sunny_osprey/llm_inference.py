@@ -2,19 +2,59 @@
 LLM Inference Module for Video Analysis
 """
 
-import json
+import importlib.util
 import logging
 import os
-import tempfile
 import time
 from typing import Dict, Any, Optional, List, Tuple
 import cv2
+import orjson
 from PIL import Image
-from transformers import AutoProcessor, Gemma3nForConditionalGeneration
+from transformers import AutoConfig, AutoProcessor, BitsAndBytesConfig, Gemma3nForConditionalGeneration
 import torch
 import setproctitle
 
 
+def _extract_top_level_json(text: str) -> Optional[str]:
+    """
+    Extract the first balanced top-level JSON object from free-form text.
+    
+    Braces inside string literals (including escaped quotes) are ignored,
+    so stray braces in values or after the object do not confuse the scan.
+    
+    Args:
+        text: Raw LLM response text
+        
+    Returns:
+        The JSON object substring, or None if no balanced object is found
+    """
+    start = text.find('{')
+    if start == -1:
+        return None
+    
+    depth = 0
+    in_string = False
+    escaped = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == '{':
+            depth += 1
+        elif ch == '}':
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return None
+
+
 class LLMInferenceEngine:
     """Handles LLM inference for video analysis."""
     
@@ -32,9 +72,21 @@ class LLMInferenceEngine:
         # Initialize LLM model (lazy loading)
         self.model = None
         self.processor = None
+        self._device: Optional[torch.device] = None
+        
+        # Text-only system + user messages shared by every event (built on first use)
+        self._prompt_messages: Optional[List[Dict[str, Any]]] = None
         
         # Setup logging
         self.logger = logging.getLogger(__name__)
+        
+        # Read prompt files once; a missing prompt is retried on first inference
+        self._user_prompt: Optional[str] = None
+        self._system_prompt: Optional[str] = None
+        try:
+            self.reload_prompts()
+        except OSError as e:
+            self.logger.warning(f"Could not read prompt file {self.prompt_file}: {e}")
     
     def _extract_frames(self, video_path: str, num_frames: int = 10) -> List[Tuple[Image.Image, float]]:
         """Extract frames from video file."""
@@ -56,18 +108,29 @@ class LLMInferenceEngine:
         
         # Calculate step size to evenly distribute frames
         step = max(1, total_frames // num_frames)
-        frames = []
+        target_indices = {i * step for i in range(num_frames)}
+        last_index = max(target_indices)
         
-        for i in range(num_frames):
-            frame_idx = i * step
-            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
-            ret, frame = cap.read()
-            if not ret:
+        # Decode sequentially instead of seeking: grab() every frame, but only
+        # retrieve() (decode + copy out) the ones we keep
+        bgr_frames = []
+        frame_indices = []
+        for frame_idx in range(last_index + 1):
+            if not cap.grab():
                 break
-            
-            img = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+            if frame_idx in target_indices:
+                ret, frame = cap.retrieve()
+                if not ret:
+                    break
+                bgr_frames.append(frame)
+                frame_indices.append(frame_idx)
+        
+        frames = []
+        for frame, frame_idx in zip(bgr_frames, frame_indices):
             timestamp = round(frame_idx / fps, 2)
-            frames.append((img, timestamp))
+            # BGR -> RGB as a reversed-channel stride view; PIL's own copy out of
+            # the view is the only copy made per frame
+            frames.append((Image.fromarray(frame[..., ::-1]), timestamp))
         
         cap.release()
         return frames
@@ -90,12 +153,11 @@ class LLMInferenceEngine:
             
             # Create custom device map to keep audio tower on CPU
             if torch.cuda.is_available():
-                # Load model temporarily to get module names
-                temp_model = Gemma3nForConditionalGeneration.from_pretrained(
-                    model_id, 
-                    torch_dtype=torch.bfloat16,
-                    device_map="cpu"  # Load on CPU first to inspect
-                )
+                # Instantiate the architecture on the meta device to get module
+                # names without loading (or allocating) any weights
+                model_config = AutoConfig.from_pretrained(model_id)
+                with torch.device("meta"):
+                    temp_model = Gemma3nForConditionalGeneration(model_config)
                 
                 # Create comprehensive device map
                 device_map = {}
@@ -108,7 +170,6 @@ class LLMInferenceEngine:
                 
                 # Clean up temp model
                 del temp_model
-                torch.cuda.empty_cache()
                 
                 model_kwargs['device_map'] = device_map
                 self.logger.info("Using custom device map: audio components on CPU, rest on GPU")
@@ -118,19 +179,15 @@ class LLMInferenceEngine:
                 self.logger.info("CUDA not available, using CPU-only mode")
             
             # Add attention implementation
-            attn_implementation = self.config.get('attn_implementation', 'eager')
-            if attn_implementation:
-                # Check if flash_attention_2 is available, fall back to eager if not
-                if attn_implementation == 'flash_attention_2':
-                    try:
-                        import flash_attn
-                        model_kwargs['attn_implementation'] = attn_implementation
-                        self.logger.info("Using Flash Attention 2 for optimized GPU memory usage")
-                    except ImportError:
-                        self.logger.warning("Flash Attention 2 not available, falling back to eager")
-                        model_kwargs['attn_implementation'] = 'eager'
-                else:
-                    model_kwargs['attn_implementation'] = attn_implementation
+            model_kwargs['attn_implementation'] = self._select_attn_implementation()
+            
+            # Optional weight-only quantization (int8/int4) via bitsandbytes
+            quantization_config = self._get_quantization_config()
+            if quantization_config is not None:
+                # torch_dtype stays bfloat16: it sets the dtype of every module
+                # bitsandbytes leaves unquantized (embeddings, norms, vision/audio
+                # towers), and Gemma3n overflows in the float16 default
+                model_kwargs['quantization_config'] = quantization_config
             
             # Only add max_memory if specified in config
             if 'max_memory' in self.config:
@@ -140,35 +197,36 @@ class LLMInferenceEngine:
                 self.logger.info("No max_memory specified in config, using default device mapping")
             
             # Use custom device map for optimal GPU memory usage
-            self.model = Gemma3nForConditionalGeneration.from_pretrained(
+            model = Gemma3nForConditionalGeneration.from_pretrained(
                 model_id, 
                 **model_kwargs
             ).eval()
             
             self.processor = AutoProcessor.from_pretrained(model_id)
+            # Device that inputs are moved to, looked up once instead of per event
+            self._device = next(iter(model.parameters())).device
             self.logger.info(f"LLM model initialized with device mapping: auto")
             
-            # Print device and size information for model parameters (sorted by size)
-            self.logger.info("Model parameter devices and sizes (sorted by size, largest first):")
-            self.logger.info(f"{'Parameter Name':<60} {'Device':<6} {'Memory(MB)':>10} {'Params(M)':>9} {'Shape'}")
-            self.logger.info("-" * 95)
-            total_params = 0
-            param_info = []
-            gpu_memory = 0
-            cpu_memory = 0
+            self._configure_generation(model)
+            self._compile_model(model)
             
-            for name, param in self.model.named_parameters():
-                param_size = param.numel() * param.element_size()
-                param_size_mb = param_size / (1024 * 1024)
-                param_count = param.numel()
-                total_params += param_count
-                param_info.append((name, param.device, param_size_mb, param_count, list(param.shape)))
-                
-                # Track memory by device
-                if param.device.type == 'cuda':
-                    gpu_memory += param_size_mb
-                else:
-                    cpu_memory += param_size_mb
+            # Publish the model only once it is fully set up, so a failure above
+            # makes the next call retry initialization instead of using it
+            self.model = model
+            
+            self._log_model_parameters()
+    
+    def _log_model_parameters(self):
+        """Log a parameter/memory summary, plus a per-parameter table at DEBUG level."""
+        # Print device and size information for model parameters (sorted by size)
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("Model parameter devices and sizes (sorted by size, largest first):")
+            self.logger.debug(f"{'Parameter Name':<60} {'Device':<6} {'Memory(MB)':>10} {'Params(M)':>9} {'Shape'}")
+            self.logger.debug("-" * 95)
+            param_info = [
+                (name, param.device, param.numel() * param.element_size() / (1024 * 1024), param.numel(), list(param.shape))
+                for name, param in self.model.named_parameters()
+            ]
             
             # Sort by size (largest first)
             param_info.sort(key=lambda x: x[2], reverse=True)
@@ -176,11 +234,173 @@ class LLMInferenceEngine:
             for name, device, size_mb, param_count, shape in param_info:
                 param_count_m = param_count / 1_000_000
                 device_str = str(device)
-                self.logger.info(f"{name:<60} {device_str:<6} {size_mb:>8.1f}MB {param_count_m:>7.1f}M {shape}")
+                self.logger.debug(f"{name:<60} {device_str:<6} {size_mb:>8.1f}MB {param_count_m:>7.1f}M {shape}")
+        
+        # Track totals and memory by device
+        total_params = sum(p.numel() for p in self.model.parameters())
+        gpu_bytes = sum(p.numel() * p.element_size() for p in self.model.parameters() if p.device.type == 'cuda')
+        cpu_bytes = sum(p.numel() * p.element_size() for p in self.model.parameters() if p.device.type != 'cuda')
+        
+        total_params_m = total_params / 1_000_000
+        gpu_memory = gpu_bytes / (1024 * 1024)
+        cpu_memory = cpu_bytes / (1024 * 1024)
+        total_memory = gpu_memory + cpu_memory
+        self.logger.info(f"Total parameters: {total_params_m:.2f}M (GPU: {gpu_memory:.2f} MB, CPU: {cpu_memory:.2f} MB, Total: {total_memory:.2f} MB)")
+    
+    def _select_attn_implementation(self) -> str:
+        """
+        Pick the attention kernel: Flash Attention 2 on CUDA when installed,
+        otherwise PyTorch SDPA, with eager only when explicitly configured.
+        """
+        attn_implementation = self.config.get('attn_implementation')
+        if attn_implementation and attn_implementation != 'flash_attention_2':
+            self.logger.info(f"Using {attn_implementation} attention from config")
+            return attn_implementation
+        
+        # Prefer Flash Attention 2 when CUDA is available, fall back to sdpa if not
+        if torch.cuda.is_available():
+            try:
+                import flash_attn
+                self.logger.info("Using Flash Attention 2 for optimized GPU memory usage")
+                return 'flash_attention_2'
+            except ImportError:
+                if attn_implementation == 'flash_attention_2':
+                    self.logger.warning("Flash Attention 2 not available, falling back to sdpa")
+            # Let SDPA dispatch to its fused flash / memory-efficient kernels
+            torch.backends.cuda.enable_flash_sdp(True)
+            torch.backends.cuda.enable_mem_efficient_sdp(True)
+        
+        self.logger.info("Using PyTorch SDPA attention")
+        return 'sdpa'
+    
+    def _get_quantization_config(self) -> Optional[BitsAndBytesConfig]:
+        """Build the bitsandbytes quantization config from the 'quantization' setting."""
+        quantization = str(self.config.get('quantization', 'none') or 'none').lower()
+        if quantization == 'none':
+            return None
+        if quantization not in ('int8', 'int4'):
+            self.logger.warning(f"Unknown quantization '{quantization}', loading unquantized model")
+            return None
+        if not torch.cuda.is_available():
+            self.logger.warning("Quantization requires CUDA, loading unquantized model")
+            return None
+        # Only check that it is installed; transformers imports it when loading
+        if importlib.util.find_spec("bitsandbytes") is None:
+            self.logger.warning("bitsandbytes not available, loading unquantized model")
+            return None
+        
+        self.logger.info(f"Using {quantization} weight-only quantization")
+        if quantization == 'int4':
+            return BitsAndBytesConfig(
+                load_in_4bit=True,
+                bnb_4bit_compute_dtype=torch.bfloat16,
+                bnb_4bit_quant_type="nf4",
+                bnb_4bit_use_double_quant=True,
+                # Audio components stay unquantized on CPU
+                llm_int8_enable_fp32_cpu_offload=True
+            )
+        return BitsAndBytesConfig(load_in_8bit=True, llm_int8_enable_fp32_cpu_offload=True)
+    
+    def _configure_generation(self, model):
+        """
+        Use a static KV cache on CUDA so the cache is allocated once and reused.
+        
+        generate() keeps the static cache on the model between calls and only
+        resets it, reallocating only when a longer prompt needs more room.
+        A fixed cache shape is also what CUDA graph capture requires.
+        
+        Args:
+            model: Loaded model to configure
+        """
+        generation_config = model.generation_config
+        if generation_config.pad_token_id is None:
+            generation_config.pad_token_id = self.processor.tokenizer.pad_token_id
+        if torch.cuda.is_available():
+            generation_config.cache_implementation = "static"
+            self.logger.info("Using static KV cache for generation")
+    
+    def _compile_model(self, model):
+        """
+        Compile the language model decoder with torch.compile (CUDA only).
+        
+        Any compile or warmup failure restores the eager decoder, so a broken
+        Inductor/Triton setup only costs speed, never startup.
+        
+        Args:
+            model: Loaded model whose decoder is compiled in place
+        """
+        compile_mode = self.config.get('torch_compile_mode', 'reduce-overhead')
+        if not compile_mode or not torch.cuda.is_available():
+            self.logger.info("torch.compile disabled, running the model in eager mode")
+            return
+        
+        self.logger.info(f"Compiling language model with torch.compile (mode={compile_mode})...")
+        eager_decoder = model.get_decoder()
+        try:
+            model.set_decoder(
+                torch.compile(eager_decoder, mode=compile_mode, fullgraph=False, dynamic=False)
+            )
             
-            total_params_m = total_params / 1_000_000
-            total_memory = gpu_memory + cpu_memory
-            self.logger.info(f"Total parameters: {total_params_m:.2f}M (GPU: {gpu_memory:.2f} MB, CPU: {cpu_memory:.2f} MB, Total: {total_memory:.2f} MB)")
+            # Trigger compilation now so the first real event isn't penalized
+            start_time = time.perf_counter()
+            warmup_messages = [{"role": "user", "content": [{"type": "text", "text": "Warm up."}]}]
+            inputs = self.processor.apply_chat_template(
+                warmup_messages, add_generation_prompt=True, tokenize=True,
+                return_dict=True, return_tensors="pt"
+            )
+            inputs = {k: v.to(self._device) for k, v in inputs.items()}
+            with torch.inference_mode():
+                model.generate(**inputs, max_new_tokens=2, do_sample=False)
+            self.logger.info(f"torch.compile warmup completed in {time.perf_counter() - start_time:.2f} seconds")
+        except Exception as e:
+            self.logger.warning(f"torch.compile failed, running the model in eager mode: {e}")
+            model.set_decoder(eager_decoder)
+    
+    def reload_prompts(self):
+        """
+        Re-read the user and system prompt files so edits apply without a restart.
+        
+        Raises:
+            OSError: If the user prompt file cannot be read
+        """
+        # Read prompt
+        with open(self.prompt_file, "r") as f:
+            user_prompt = f.read()
+        
+        # Read system prompt from system_prompt.txt in working directory
+        try:
+            with open('system_prompt.txt', 'r') as sysf:
+                system_prompt = sysf.read().strip()
+        except Exception as e:
+            self.logger.error(f"Could not read system_prompt.txt: {e}")
+            system_prompt = "You are a helpful security camera video analysis assistant."
+        
+        self._user_prompt = user_prompt
+        self._system_prompt = system_prompt
+        self._prompt_messages = None
+    
+    def _get_prompt_messages(self) -> List[Dict[str, Any]]:
+        """
+        Build the system + user text messages once and reuse them across events.
+        
+        The KV cache for this prefix is not reused: Gemma3n only forwards
+        pixel_values when prefill starts at position 0, so a cached prefix
+        would drop the images.
+        """
+        if self._user_prompt is None:
+            self.reload_prompts()
+        if self._prompt_messages is None:
+            self._prompt_messages = [
+                {
+                    "role": "system",
+                    "content": [{"type": "text", "text": self._system_prompt}]
+                },
+                {
+                    "role": "user",
+                    "content": [{"type": "text", "text": self._user_prompt}]
+                }
+            ]
+        return self._prompt_messages
     
     def run_inference(self, video_path: str) -> Optional[Dict[str, Any]]:
         """Run LLM inference on video frames."""
@@ -194,44 +414,35 @@ class LLMInferenceEngine:
                 self.logger.error("No frames extracted from video")
                 return None
             
-            # Read prompt
-            with open(self.prompt_file, "r") as f:
-                user_prompt = f.read()
-            
-            # Read system prompt from system_prompt.txt in working directory
-            try:
-                with open('system_prompt.txt', 'r') as sysf:
-                    system_prompt = sysf.read().strip()
-            except Exception as e:
-                self.logger.error(f"Could not read system_prompt.txt: {e}")
-                system_prompt = "You are a helpful security camera video analysis assistant."
+            # Static prompt prefix, followed by this event's frames
+            prompt_messages = self._get_prompt_messages()
             messages = [
-                {
-                    "role": "system",
-                    "content": [{"type": "text", "text": system_prompt}]
-                },
+                prompt_messages[0],
                 {
                     "role": "user",
-                    "content": [{"type": "text", "text": user_prompt}]
+                    "content": list(prompt_messages[1]["content"])
                 }
             ]
             
-            # Add frames to messages
-            frames_dir = tempfile.mkdtemp(prefix="frames_")
-            try:
-                for img, timestamp in video_frames:
-                    frame_path = os.path.join(frames_dir, f"frame_{timestamp}.png")
-                    img.save(frame_path)
-                    messages[1]["content"].append({"type": "image", "url": frame_path})
-                
-                # Process with model
-                inputs = self.processor.apply_chat_template(
-                    messages, add_generation_prompt=True, tokenize=True,
-                    return_dict=True, return_tensors="pt"
-                )
+            # Add frames to messages as in-memory PIL images (no encode/decode round trip)
+            for img, _timestamp in video_frames:
+                messages[1]["content"].append({"type": "image", "image": img})
+            
+            # Process with model
+            inputs = self.processor.apply_chat_template(
+                messages, add_generation_prompt=True, tokenize=True,
+                return_dict=True, return_tensors="pt"
+            )
+            # No autograd bookkeeping needed: this engine only runs inference
+            with torch.inference_mode():
                 # Move to appropriate device (GPU if available, otherwise CPU)
-                device = next(self.model.parameters()).device
-                inputs = {k: v.to(device) for k, v in inputs.items()}
+                device = self._device
+                if device.type == 'cuda':
+                    # Pinned host memory lets the copies run asynchronously; they are
+                    # queued on the same stream as generate(), so no sync is needed
+                    inputs = {k: v.pin_memory().to(device, non_blocking=True) for k, v in inputs.items()}
+                else:
+                    inputs = {k: v.to(device) for k, v in inputs.items()}
                 
                 input_length = inputs["input_ids"].shape[-1]
                 
@@ -244,31 +455,24 @@ class LLMInferenceEngine:
                 )
                 output = output[0][input_length:]
                 response = self.processor.decode(output, skip_special_tokens=True)
-                end_time = time.perf_counter()
-                
-                self.logger.info(f"LLM inference completed in {end_time - start_time:.2f} seconds")
-                
-                # Parse JSON response
-                try:
-                    # Extract JSON from response (in case there's extra text)
-                    json_start = response.find('{')
-                    json_end = response.rfind('}') + 1
-                    if json_start != -1 and json_end != 0:
-                        json_str = response[json_start:json_end]
-                        result = json.loads(json_str)
-                        return result
-                    else:
-                        self.logger.error("No JSON found in LLM response")
-                        return {"error": "No JSON found in response", "raw_response": response}
-                        
-                except json.JSONDecodeError as e:
-                    self.logger.error(f"Failed to parse JSON response: {e}")
-                    return {"error": "Invalid JSON response", "raw_response": response}
+            end_time = time.perf_counter()
+            
+            self.logger.info(f"LLM inference completed in {end_time - start_time:.2f} seconds")
+            
+            # Parse JSON response
+            try:
+                # Extract JSON from response (in case there's extra text)
+                json_str = _extract_top_level_json(response)
+                if json_str is not None:
+                    result = orjson.loads(json_str.encode())
+                    return result
+                else:
+                    self.logger.error("No JSON found in LLM response")
+                    return {"error": "No JSON found in response", "raw_response": response}
                     
-            finally:
-                # Clean up frames directory
-                import shutil
-                shutil.rmtree(frames_dir, ignore_errors=True)
+            except orjson.JSONDecodeError as e:
+                self.logger.error(f"Failed to parse JSON response: {e}")
+                return {"error": "Invalid JSON response", "raw_response": response}
                 
         except Exception as e:
             import traceback
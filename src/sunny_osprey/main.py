@@ -3,6 +3,7 @@ Main module for the Sunny Osprey project.
 """
 
 import argparse
+import functools
 import sys
 import time
 import os
@@ -80,13 +81,22 @@ def run_mqtt_processor(config_path: str = "/app/sunny-osprey-config.yaml"):
             # Only sleep if not exiting due to KeyboardInterrupt
             time.sleep(5)
 
-def parse_arguments():
-    """Parse command line arguments."""
+@functools.lru_cache(maxsize=1)
+def _build_parser() -> argparse.ArgumentParser:
+    """Build the command line parser once; parse_args does not mutate it."""
     parser = argparse.ArgumentParser(description="Sunny Osprey MQTT Event Processor")
     parser.add_argument("--config", default="/app/sunny-osprey-config.yaml",
                        help="Path to configuration file (default: /app/sunny-osprey-config.yaml)")
+    return parser
+
+def parse_arguments(argv=None):
+    """
+    Parse command line arguments.
     
-    return parser.parse_args()
+    Args:
+        argv: Argument list to parse; defaults to sys.argv[1:]
+    """
+    return _build_parser().parse_args(argv)
 
 if __name__ == "__main__":
     args = parse_arguments()
@@ -2,27 +2,44 @@
 MQTT Event Processor for Frigate Security Camera Events
 """
 
-import json
+import errno
 import logging
 import os
+import shutil
 import tempfile
+import threading
 import time
-from typing import Dict, Any, Optional
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, Any, Optional, Tuple, TYPE_CHECKING
+from urllib.parse import quote
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+import urllib3
+from urllib3.util.retry import Retry
 import paho.mqtt.client as mqtt
-from .llm_inference import LLMInferenceEngine
 from .alert_manager import AlertManager, is_suspicious_activity_detected
 from .config import SunnyOspreyConfig
 import signal
 import sys
 
+if TYPE_CHECKING:
+    # torch/transformers are only needed once an engine is actually created
+    from .llm_inference import LLMInferenceEngine
+
+
+# Serialized forms of '"type": "end"' (Frigate uses json.dumps default separators)
+_END_TYPE_SPACED = b'"type": "end"'
+_END_TYPE_COMPACT = b'"type":"end"'
+
 
 class FrigateEventProcessor:
     """Processes Frigate MQTT events and runs LLM inference on video clips."""
     
     def __init__(self, mqtt_host: str = "127.0.0.1", mqtt_port: int = 1883,
                  api_base_url: str = "http://127.0.0.1:5000",
-                 prompt_file: str = "prompt.txt", llm_engine: Optional[LLMInferenceEngine] = None,
+                 prompt_file: str = "prompt.txt", llm_engine: Optional["LLMInferenceEngine"] = None,
                  config: Optional[SunnyOspreyConfig] = None):
         """
         Initialize the Frigate event processor.
@@ -44,6 +61,20 @@ class FrigateEventProcessor:
         self.api_base_url = api_base_url or self.config.get_frigate_api_url()
         self.prompt_file = prompt_file or self.config.get_prompt_file()
         
+        # Clip URL template built once; literal '%' in the base URL is escaped
+        self._clip_url_template = self.api_base_url.rstrip('/').replace('%', '%%') + "/api/events/%s/clip.mp4"
+        # The healthcheck readiness file only needs writing once per process
+        self._ready_written = False
+        # Downloaded clips go to memory-backed /dev/shm when available so they
+        # never touch disk; frigate.clip_tmp_dir overrides the location
+        clip_tmp_dir = self.config.get_frigate_config().get('clip_tmp_dir')
+        if clip_tmp_dir is None and os.access('/dev/shm', os.W_OK):
+            clip_tmp_dir = '/dev/shm'
+        self._clip_tmp_dir = clip_tmp_dir
+        
+        # Keep-alive session for Frigate API downloads
+        self._http = self._create_http_session()
+        
         # Initialize MQTT client
         self.mqtt_client = mqtt.Client()
         self.mqtt_client.on_connect = self._on_connect
@@ -53,6 +84,7 @@ class FrigateEventProcessor:
         if llm_engine is not None:
             self.llm_engine = llm_engine
         else:
+            from .llm_inference import LLMInferenceEngine
             llm_config = self.config.get_llm_config()
             self.llm_engine = LLMInferenceEngine(prompt_file=prompt_file, config=llm_config)
         
@@ -60,9 +92,51 @@ class FrigateEventProcessor:
         alerts_config = self.config.get_alerts_config()
         self.alert_manager = AlertManager(alerts_config)
         
+        # Events are processed off the MQTT network thread so slow downloads and
+        # inference don't stall message delivery. The semaphore bounds how many
+        # events may be running or waiting; extra events are dropped.
+        mqtt_config = self.config.get_mqtt_config()
+        workers = int(mqtt_config.get('workers', 2))
+        max_pending = int(mqtt_config.get('max_pending_events', 32))
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sunny-osprey-event")
+        # Set by stop() so events already running skip their remaining work
+        self._stopping = threading.Event()
+        self._pending_events = threading.BoundedSemaphore(workers + max_pending)
+        # The LLM engine is not re-entrant, so inference runs one event at a time
+        self._inference_lock = threading.Lock()
+        # Alerts are sent from their own pool so slow Telegram/Grafana calls don't
+        # hold up the next event; the semaphore makes event workers wait (rather
+        # than queue clips without bound) when too many alerts are outstanding
+        self._alert_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="sunny-osprey-alert")
+        self._pending_alerts = threading.BoundedSemaphore(8)
+        # Outstanding alert futures, drained by stop() before the backends close
+        self._alert_futures = set()
+        self._alert_futures_lock = threading.Lock()
+        self._alert_drain_timeout = 30
+        
+        # Bounded LRU of recently processed event IDs; Frigate can re-emit "end"
+        # events (e.g. on reconnect) and each duplicate would re-run inference
+        self._seen_events: "OrderedDict[str, None]" = OrderedDict()
+        self._seen_events_max = 512
+        self._seen_events_lock = threading.Lock()
+        
         # Setup logging is now handled by config
         self.logger = logging.getLogger(__name__)
     
+    def _create_http_session(self) -> requests.Session:
+        """Create a pooled HTTP session that retries transient Frigate API failures."""
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            max_retries=Retry(
+                total=3,
+                backoff_factor=1,
+                status_forcelist=[502, 503, 504]
+            )
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+    
     def _on_connect(self, client, userdata, flags, rc):
         """Callback for MQTT connection."""
         if rc == 0:
@@ -70,34 +144,59 @@ class FrigateEventProcessor:
             client.subscribe("frigate/events")
             self.logger.info("Subscribed to frigate/events")
             # Indicate readiness for healthcheck
-            try:
-                with open("/shared/ready", "w") as f:
-                    f.write("ready\n")
-            except Exception as e:
-                self.logger.warning(f"Failed to write readiness file: {e}")
+            if not self._ready_written:
+                try:
+                    with open("/shared/ready", "w") as f:
+                        f.write("ready\n")
+                    self._ready_written = True
+                except Exception as e:
+                    self.logger.warning("Failed to write readiness file: %s", e)
         else:
-            self.logger.error(f"Failed to connect to MQTT broker with code {rc}")
+            self.logger.error("Failed to connect to MQTT broker with code %s", rc)
     
     def _on_message(self, client, userdata, msg):
         """Callback for MQTT messages."""
+        # Cheap byte check before decoding: most Frigate events are "new"/"update"
+        if _END_TYPE_COMPACT not in msg.payload and _END_TYPE_SPACED not in msg.payload:
+            return
         try:
-            payload = json.loads(msg.payload.decode())
-            self.logger.debug(f"Received MQTT event: {payload.get('type', 'unknown')}")
+            payload = orjson.loads(msg.payload)
+            self.logger.debug("Received MQTT event: %s", payload.get('type', 'unknown'))
             
             # Process only "end" events
             if payload.get("type") == "end":
                 # Check if we should process this event based on configuration
                 if self._should_process_event(payload):
-                    self._process_end_event(payload)
+                    self._submit_end_event(payload)
                 else:
-                    self.logger.debug(f"Skipping event based on configuration filters")
+                    self.logger.debug("Skipping event based on configuration filters")
             else:
-                self.logger.debug(f"Skipping non-end event: {payload.get('type')}")
+                self.logger.debug("Skipping non-end event: %s", payload.get('type'))
                 
-        except json.JSONDecodeError as e:
-            self.logger.error(f"Failed to parse MQTT message: {e}")
+        except orjson.JSONDecodeError as e:
+            self.logger.error("Failed to parse MQTT message: %s", e)
         except Exception as e:
-            self.logger.error(f"Error processing MQTT message: {e}")
+            self.logger.error("Error processing MQTT message: %s", e)
+    
+    def _submit_end_event(self, event_data: Dict[str, Any]):
+        """
+        Hand an end event to the worker pool without blocking the MQTT thread.
+        
+        Args:
+            event_data: Event data from Frigate
+        """
+        if not self._pending_events.acquire(blocking=False):
+            event_id = (event_data.get("after") or {}).get("id")
+            self.logger.warning("Event queue is full, dropping event %s", event_id)
+            return
+        try:
+            future = self._executor.submit(self._process_end_event, event_data)
+        except RuntimeError as e:
+            # Executor already shut down
+            self._pending_events.release()
+            self.logger.warning("Not processing event, processor is stopping: %s", e)
+            return
+        future.add_done_callback(lambda _: self._pending_events.release())
     
     def _should_process_event(self, event_data: Dict[str, Any]) -> bool:
         """
@@ -118,25 +217,54 @@ class FrigateEventProcessor:
                 camera_name = event_data['before'].get('camera')
             
             if camera_name:
-                self.logger.debug(f"Event from camera: {camera_name}")
+                self.logger.debug("Event from camera: %s", camera_name)
                 
                 # Check camera filtering
                 if not self.config.should_process_camera(camera_name):
-                    self.logger.debug(f"Skipping event from camera '{camera_name}' (not in enabled cameras list)")
+                    self.logger.debug("Skipping event from camera '%s' (not in enabled cameras list)", camera_name)
                     return False
             
             # Check other filters using the config
             if self.config.should_skip_event(event_data.get('after', {}) or event_data.get('before', {})):
-                self.logger.debug(f"Skipping event based on processing filters")
+                self.logger.debug("Skipping event based on processing filters")
                 return False
             
             return True
             
         except Exception as e:
-            self.logger.error(f"Error checking if event should be processed: {e}")
+            self.logger.error("Error checking if event should be processed: %s", e)
             # Default to processing if there's an error
             return True
     
+    def _mark_event_seen(self, event_id: str) -> bool:
+        """
+        Record an event ID as processed.
+        
+        Args:
+            event_id: Frigate event ID
+            
+        Returns:
+            True if the event was not seen recently, False for a duplicate
+        """
+        with self._seen_events_lock:
+            if event_id in self._seen_events:
+                self._seen_events.move_to_end(event_id)
+                return False
+            self._seen_events[event_id] = None
+            if len(self._seen_events) > self._seen_events_max:
+                self._seen_events.popitem(last=False)
+            return True
+    
+    def _forget_event(self, event_id: str):
+        """
+        Drop an event ID recorded by _mark_event_seen so the event can be processed again.
+        
+        Args:
+            event_id: Frigate event ID
+        """
+        with self._seen_events_lock:
+            self._seen_events.pop(event_id, None)
+    
     def _process_end_event(self, event_data: Dict[str, Any]):
         """Process an end event from Frigate."""
         try:
@@ -146,45 +274,145 @@ class FrigateEventProcessor:
                 self.logger.error("No event ID found in event data")
                 return
             
-            self.logger.info(f"Processing end event: {event_id}")
-            
-            # Download video clip
-            video_path = self._download_video_clip(event_id, event_data)
-            if not video_path:
+            if not self._mark_event_seen(event_id):
+                self.logger.info("Skipping duplicate end event: %s", event_id)
                 return
             
-            # Run LLM inference
-            result = self.llm_engine.run_inference(video_path)
-            if result:
-                # Add video_path to result for Telegram video sending
-                result['video_path'] = video_path
-                print(json.dumps(result, indent=2))
+            # The ID is claimed up front so a concurrent duplicate is skipped, and
+            # released again unless processing succeeds so a re-emitted end event
+            # gets another try
+            processed = False
+            try:
+                if self._stopping.is_set():
+                    self.logger.info("Processor is stopping, skipping event %s", event_id)
+                    return
                 
-                # Send incident to alert manager for all events
-                is_suspicious = is_suspicious_activity_detected(result)
-                if is_suspicious:
-                    self.logger.info(f"Suspicious activity detected for event {event_id}, processing alert")
-                else:
-                    self.logger.info(f"Normal activity detected for event {event_id}, processing notification")
+                self.logger.info("Processing end event: %s", event_id)
                 
-                incident_sent = self.alert_manager.send_incident(event_id, result)
-                if incident_sent:
-                    self.logger.info(f"Alert/notification processed successfully for event {event_id}")
-                else:
-                    self.logger.warning(f"Failed to process alert/notification for event {event_id}")
-            
-            # Clean up temporary file (but not local test files)
-            if not video_path.startswith('/app/test_videos/'):
+                # Download video clip
+                video_path = self._download_video_clip(event_id, event_data)
+                if not video_path:
+                    return
+                
+                # Run LLM inference
                 try:
-                    os.remove(video_path)
-                    self.logger.debug(f"Cleaned up temporary file: {video_path}")
-                except Exception as e:
-                    self.logger.warning(f"Failed to clean up {video_path}: {e}")
-            else:
-                self.logger.debug(f"Keeping local test file: {video_path}")
+                    with self._inference_lock:
+                        if self._stopping.is_set():
+                            self.logger.info("Processor is stopping, skipping inference for event %s", event_id)
+                            result = None
+                        else:
+                            result = self.llm_engine.run_inference(video_path)
+                except Exception:
+                    self._cleanup_video_clip(video_path)
+                    raise
+                if result:
+                    if self.logger.isEnabledFor(logging.DEBUG):
+                        self.logger.debug("LLM result: %s", orjson.dumps(result, option=orjson.OPT_INDENT_2).decode())
+                    
+                    # Alerting (and clip cleanup once the upload is done) continues in the alert pool
+                    self._submit_alert(event_id, result, video_path)
+                    processed = True
+                else:
+                    self._cleanup_video_clip(video_path)
+            finally:
+                if not processed:
+                    self._forget_event(event_id)
                 
         except Exception as e:
-            self.logger.error(f"Error processing end event: {e}")
+            self.logger.error("Error processing end event: %s", e)
+    
+    def _submit_alert(self, event_id: str, result: Dict[str, Any], video_path: str):
+        """
+        Queue an incident on the alert pool, waiting if too many alerts are pending.
+        
+        Args:
+            event_id: Frigate event ID
+            result: LLM inference result
+            video_path: Path of the analyzed clip, removed after the alert is sent
+        """
+        self._pending_alerts.acquire()
+        try:
+            future = self._alert_executor.submit(self._send_alert, event_id, result, video_path)
+        except RuntimeError:
+            # Alert pool already shut down by stop(); the backends may be closed too
+            self._pending_alerts.release()
+            self.logger.warning("Processor is stopping, dropping alert for event %s", event_id)
+            self._cleanup_video_clip(video_path)
+            return
+        with self._alert_futures_lock:
+            self._alert_futures.add(future)
+        future.add_done_callback(lambda f: self._on_alert_done(f, event_id, video_path))
+    
+    def _on_alert_done(self, future, event_id: str, video_path: str):
+        """Release the alert slot, and log failures or clean up after a cancelled alert."""
+        with self._alert_futures_lock:
+            self._alert_futures.discard(future)
+        self._pending_alerts.release()
+        if future.cancelled():
+            # _send_alert never ran, so the clip is still on disk
+            self.logger.warning("Alert for event %s cancelled during shutdown", event_id)
+            self._cleanup_video_clip(video_path)
+        elif future.exception() is not None:
+            self.logger.error("Error sending alert: %s", future.exception())
+    
+    def _send_alert(self, event_id: str, result: Dict[str, Any], video_path: str):
+        """Send an incident to the alert manager, then remove the clip."""
+        try:
+            # Send incident to alert manager for all events
+            is_suspicious = is_suspicious_activity_detected(result)
+            if is_suspicious:
+                self.logger.info("Suspicious activity detected for event %s, processing alert", event_id)
+            else:
+                self.logger.info("Normal activity detected for event %s, processing notification", event_id)
+            
+            incident_sent = self.alert_manager.send_incident(event_id, result, video_path=video_path)
+            if incident_sent:
+                self.logger.info("Alert/notification processed successfully for event %s", event_id)
+            else:
+                self.logger.warning("Failed to process alert/notification for event %s", event_id)
+        finally:
+            self._cleanup_video_clip(video_path)
+    
+    def _cleanup_video_clip(self, video_path: str):
+        """Remove a downloaded clip (but not local test files)."""
+        if not video_path.startswith('/app/test_videos/'):
+            try:
+                os.remove(video_path)
+                self.logger.debug("Cleaned up temporary file: %s", video_path)
+            except Exception as e:
+                self.logger.warning("Failed to clean up %s: %s", video_path, e)
+        else:
+            self.logger.debug("Keeping local test file: %s", video_path)
+    
+    def _fetch_clip(self, url: str, tmp_dir: Optional[str]) -> Tuple[str, int]:
+        """
+        Stream a clip from the Frigate API into a new temporary file.
+        
+        Args:
+            url: Clip URL
+            tmp_dir: Directory for the temporary file, or None for the system default
+            
+        Returns:
+            Tuple of (temporary file path, size in bytes)
+        """
+        temp_path = None
+        try:
+            with self._http.get(url, stream=True, timeout=(5, 60)) as response:
+                response.raise_for_status()
+                # Let urllib3 undo any Content-Encoding while streaming
+                response.raw.decode_content = True
+
+                # Stream to a temporary file instead of buffering the whole clip in memory
+                with tempfile.NamedTemporaryFile(suffix=".mp4", delete=False, dir=tmp_dir) as f:
+                    temp_path = f.name
+                    shutil.copyfileobj(response.raw, f, length=1024 * 1024)
+                    file_size = f.tell()
+        except Exception:
+            # Don't leave a partially written clip behind
+            if temp_path and os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return temp_path, file_size
     
     def _download_video_clip(self, event_id: str, event_data: Optional[Dict[str, Any]] = None) -> Optional[str]:
         """Download video clip from Frigate API or use local test file."""
@@ -195,54 +423,59 @@ class FrigateEventProcessor:
                 if event_data and 'after' in event_data:
                     video_path = event_data['after'].get('video_path')
                     if video_path and os.path.exists(video_path):
-                        self.logger.info(f"Using local test video: {video_path}")
+                        self.logger.info("Using local test video: %s", video_path)
                         return video_path
                     else:
-                        self.logger.error(f"Test video file not found: {video_path}")
+                        self.logger.error("Test video file not found: %s", video_path)
                         return None
                 else:
-                    self.logger.error(f"No event data provided for test event: {event_id}")
+                    self.logger.error("No event data provided for test event: %s", event_id)
                     return None
             
             # Regular Frigate API download
-            url = f"{self.api_base_url}/api/events/{event_id}/clip.mp4"
-            self.logger.info(f"Downloading video clip from: {url}")
+            url = self._clip_url_template % quote(event_id, safe='')
+            self.logger.info("Downloading video clip from: %s", url)
             
+            # The session retries failed connects and 502/503/504 responses on its
+            # own; this loop also covers errors while streaming the body (connection
+            # reset, truncated transfer), error statuses and empty clips (Frigate
+            # still finalizing the file)
             for attempt in range(3):
                 try:
-                    response = requests.get(url, timeout=30)
-                    response.raise_for_status()
-
-                    # Save to temporary file
-                    with tempfile.NamedTemporaryFile(suffix=".mp4", delete=False) as f:
-                        f.write(response.content)
-                        temp_path = f.name
-                    # Check file size
-                    file_size = os.path.getsize(temp_path)
-                    self.logger.info(f"Downloaded video clip to: {temp_path}, size: {file_size} bytes ({file_size / (1024*1024):.2f} MB)")
-
-                    if file_size == 0:
-                        self.logger.warning(f"Attempt {attempt+1}/3: Downloaded file is empty (0 bytes)")
-                        os.remove(temp_path)  # Clean up empty file
-                        if attempt == 2:  # Last attempt
-                            self.logger.error("Failed to download non-empty video clip after 3 attempts")
-                            return None
+                    try:
+                        temp_path, file_size = self._fetch_clip(url, self._clip_tmp_dir)
+                    except OSError as e:
+                        # A full /dev/shm (64 MB by default outside docker-compose) or
+                        # clip_tmp_dir should not drop the event; use the regular temp dir
+                        if (self._clip_tmp_dir is None or isinstance(e, requests.exceptions.RequestException)
+                                or e.errno not in (errno.ENOSPC, errno.EDQUOT)):
+                            raise
+                        self.logger.warning("No space for clip in %s (%s), falling back to %s",
+                                            self._clip_tmp_dir, e, tempfile.gettempdir())
+                        temp_path, file_size = self._fetch_clip(url, None)
+                except (requests.exceptions.RequestException, urllib3.exceptions.HTTPError) as e:
+                    self.logger.warning("Attempt %s/3: Failed to download video clip: %s", attempt+1, e)
+                    if attempt < 2:
                         time.sleep(3)  # Wait before retry
-                        continue
-                    else:
-                        return temp_path
+                    continue
+                self.logger.info("Downloaded video clip to: %s, size: %s bytes (%.2f MB)", temp_path, file_size, file_size / (1024*1024))
 
-                except Exception as e:
-                    self.logger.error(f"Attempt {attempt+1}/3: Failed to download video clip: {e}")
-                    if attempt == 2:  # Last attempt
-                        return None
+                if file_size > 0:
+                    return temp_path
+
+                self.logger.warning("Attempt %s/3: Downloaded file is empty (0 bytes)", attempt+1)
+                os.remove(temp_path)  # Clean up empty file
+                if attempt < 2:
                     time.sleep(3)  # Wait before retry
 
+            self.logger.error("Failed to download non-empty video clip after 3 attempts")
+            return None
+
         except requests.exceptions.RequestException as e:
-            self.logger.error(f"Failed to download video clip: {e}")
+            self.logger.error("Failed to download video clip: %s", e)
             return None
         except Exception as e:
-            self.logger.error(f"Error downloading video clip: {e}")
+            self.logger.error("Error downloading video clip: %s", e)
             return None
     
 
@@ -250,16 +483,38 @@ class FrigateEventProcessor:
     def start(self):
         """Start the MQTT client and begin processing events."""
         try:
-            self.logger.info(f"Connecting to MQTT broker at {self.mqtt_host}:{self.mqtt_port}")
+            self.logger.info("Connecting to MQTT broker at %s:%s", self.mqtt_host, self.mqtt_port)
             self.mqtt_client.connect(self.mqtt_host, self.mqtt_port, 60)
             self.mqtt_client.loop_forever()
         except Exception as e:
-            self.logger.error(f"Failed to start MQTT client: {e}")
+            self.logger.error("Failed to start MQTT client: %s", e)
     
     def stop(self):
-        """Stop the MQTT client."""
+        """
+        Stop the processor.
+        
+        MQTT intake stops first, then queued events are cancelled, then
+        outstanding alerts get a bounded wait to finish (the rest are
+        cancelled), and only then are the alert backends closed.
+        """
         self.mqtt_client.loop_stop()
         self.mqtt_client.disconnect()
+        # Cancel queued events (their done callbacks free the queue slots);
+        # events already running see _stopping and skip the rest of their work
+        self._stopping.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        
+        # No new alerts; give queued and in-flight ones a chance to finish
+        self._alert_executor.shutdown(wait=False)
+        with self._alert_futures_lock:
+            alert_futures = list(self._alert_futures)
+        _, not_done = wait(alert_futures, timeout=self._alert_drain_timeout)
+        for future in not_done:
+            future.cancel()
+        if not_done:
+            self.logger.warning("%s alert(s) not sent before shutdown", len(not_done))
+        
+        self.alert_manager.close()
         self.logger.info("MQTT client stopped")
 
 
@@ -1,8 +1,22 @@
 import os
 import asyncio
+import concurrent.futures
+import importlib.util
+import random
+import threading
+from datetime import timedelta
 from telegram import Bot
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+from telegram.request import HTTPXRequest
 import logging
 from typing import Dict, Any
+from .incident import Incident
+
+# Telegram rejects media captions longer than this
+TELEGRAM_CAPTION_LIMIT = 1024
+# Upper bound on waiting for one coroutine on the alert loop; covers three
+# video upload attempts at the 120 s HTTP timeouts plus backoff
+TELEGRAM_RUN_TIMEOUT = 900
 
 class TelegramAlert:
     def __init__(self, config: Dict[str, Any] = None):
@@ -16,6 +30,13 @@ class TelegramAlert:
         
         self.logger = logging.getLogger(__name__)
         self.enabled = self._validate_config()
+        
+        # One long-lived Bot (and its HTTPX connection pool) on a persistent event
+        # loop, both created on first send
+        self._bot = None
+        self._loop = None
+        self._loop_lock = threading.Lock()
+        self._closed = False
 
     def _validate_config(self):
         if not self.telegram_token or not self.telegram_chat_id:
@@ -23,58 +44,148 @@ class TelegramAlert:
             return False
         return True
 
-    async def _send_telegram_message(self, messages):
-        bot = Bot(token=str(self.telegram_token))
-        text = '\n'.join(messages)
-        async with bot:
-            await bot.send_message(text=text, chat_id=str(self.telegram_chat_id))
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._loop_lock:
+            if self._closed:
+                raise RuntimeError("Telegram alert backend is closed")
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=loop.run_forever, name="telegram-alert-loop", daemon=True
+                ).start()
+                self._loop = loop
+            return self._loop
+
+    def _run(self, coro):
+        # Run a coroutine on the persistent loop and wait for its result; the
+        # timeout keeps a caller from blocking forever if the loop goes away
+        future = asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+        try:
+            return future.result(timeout=TELEGRAM_RUN_TIMEOUT)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    def _create_request(self) -> HTTPXRequest:
+        # HTTP/2 lets retries and concurrent sends share one TLS connection; it
+        # needs the optional h2 package, otherwise stay on HTTP/1.1
+        http_version = '2' if importlib.util.find_spec("h2") is not None else '1.1'
+        return HTTPXRequest(
+            http_version=http_version,
+            connection_pool_size=8,
+            pool_timeout=None,
+            read_timeout=120,
+            write_timeout=120
+        )
+
+    async def _get_bot(self) -> Bot:
+        # Only ever called on the persistent loop, so no locking is needed
+        if self._bot is None:
+            bot = Bot(token=str(self.telegram_token), request=self._create_request())
+            await bot.initialize()
+            self._bot = bot
+        return self._bot
+
+    @staticmethod
+    async def _cancel_pending_tasks():
+        # Cancel every other task on the loop and wait until they have unwound,
+        # which also completes the futures callers are waiting on in _run
+        current = asyncio.current_task()
+        tasks = [task for task in asyncio.all_tasks() if task is not current]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def close(self):
+        """Cancel pending sends, shut down the Bot's HTTP client and stop the event loop thread."""
+        with self._loop_lock:
+            self._closed = True
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._cancel_pending_tasks(), loop).result(timeout=10)
+        except Exception as e:
+            self.logger.warning("Error cancelling pending Telegram sends: %s", e)
+        if self._bot is not None:
+            try:
+                asyncio.run_coroutine_threadsafe(self._bot.shutdown(), loop).result(timeout=10)
+            except Exception as e:
+                self.logger.warning("Error shutting down Telegram bot: %s", e)
+            self._bot = None
+        loop.call_soon_threadsafe(loop.stop)
+
+    async def _send_telegram_message(self, text: str, reply_to_message_id: int = None):
+        bot = await self._get_bot()
+        await bot.send_message(
+            text=text,
+            chat_id=str(self.telegram_chat_id),
+            reply_to_message_id=reply_to_message_id
+        )
 
     async def _send_telegram_video(self, video_path: str, caption: str = ""):
+        # Read the clip once so retries don't go back to disk
+        with open(video_path, 'rb') as video_file:
+            video_data = video_file.read()
+        filename = os.path.basename(video_path)
         for attempt in range(3):
             try:
-                bot = Bot(token=str(self.telegram_token))
-                async with bot:
-                    with open(video_path, 'rb') as video_file:
-                        await bot.send_video(
-                            chat_id=str(self.telegram_chat_id),
-                            video=video_file,
-                            caption=caption,
-                            write_timeout=120,  # Increase write timeout
-                            read_timeout=120   # Increase read timeout
-                        )
-                return True
-            except Exception as e:
-                self.logger.error(f"Attempt {attempt+1}/3: Error sending Telegram video: {e}")
+                bot = await self._get_bot()
+                return await bot.send_video(
+                    chat_id=str(self.telegram_chat_id),
+                    video=video_data,
+                    filename=filename,
+                    caption=caption,
+                    write_timeout=120,  # Increase write timeout
+                    read_timeout=120   # Increase read timeout
+                )
+            except (BadRequest, Forbidden) as e:
+                # Permanent failures (bad chat, file too large, bot blocked); retrying won't help.
+                # Checked first because BadRequest is itself a NetworkError subclass
+                self.logger.error("Telegram rejected video, not retrying: %s", e)
+                raise
+            except RetryAfter as e:
+                # Flood control: wait as long as Telegram asks before the next attempt
+                self.logger.warning("Attempt %s/3: Telegram flood control, retrying in %s: %s", attempt+1, e.retry_after, e)
+                if attempt == 2:
+                    raise
+                retry_after = e.retry_after
+                if isinstance(retry_after, timedelta):
+                    retry_after = retry_after.total_seconds()
+                await asyncio.sleep(retry_after)
+            except NetworkError as e:
+                # Transient connection problems and timeouts (TimedOut is a NetworkError);
+                # anything else (InvalidToken, Conflict, programming errors) is raised as is
+                self.logger.error("Attempt %s/3: Error sending Telegram video: %s", attempt+1, e)
                 if attempt == 2:
                     raise
-                await asyncio.sleep(2)
-        return False
+                # Exponential backoff with jitter
+                await asyncio.sleep(min(2 ** attempt, 10) + random.random())
+        return None
 
-    def send_incident(self, incident_data: Dict[str, Any]) -> bool:
+    def send_incident(self, incident: Incident) -> bool:
         if not self.enabled:
             self.logger.warning("Telegram alerts are disabled due to missing configuration")
             return False
         try:
-            is_suspicious = incident_data.get('is_suspicious', False)
-            event_id = incident_data.get('event_id')
+            event_id = incident.event_id
             
-            if is_suspicious:
-                self.logger.info(f"Suspicious activity detected for event {event_id}, sending Telegram alert")
+            if incident.is_suspicious:
+                self.logger.info("Suspicious activity detected for event %s, sending Telegram alert", event_id)
             else:
-                self.logger.info(f"Normal activity detected for event {event_id}, sending Telegram notification")
+                self.logger.info("Normal activity detected for event %s, sending Telegram notification", event_id)
             
-            description = incident_data.get('description', 'No description available')
-            video_url = incident_data.get('video_url')
-            messages = [description]
-            # if video_url:
-            #    messages.append(video_url)
-            # asyncio.run(self._send_telegram_message(messages))
-            # Also send the video file if available
-            video_path = incident_data.get('llm_result', {}).get('video_path')
+            description = incident.description
+            # Send the video file with the description as its caption (one API call)
+            video_path = incident.video_path
             if video_path and os.path.exists(video_path):
-                caption = incident_data.get('description', 'No description available')
-                asyncio.run(self._send_telegram_video(video_path, caption))
+                caption = description[:TELEGRAM_CAPTION_LIMIT]
+                message = self._run(self._send_telegram_video(video_path, caption))
+                remainder = description[TELEGRAM_CAPTION_LIMIT:]
+                if remainder and message is not None:
+                    # Overflow goes in a reply to the video
+                    self._run(self._send_telegram_message(remainder, reply_to_message_id=message.message_id))
             return True
         except Exception as e:
-            self.logger.error(f"Error sending Telegram alert for event {incident_data.get('event_id')}: {e}")
-            return False 
\ No newline at end of file
+            self.logger.error("Error sending Telegram alert for event %s: %s", incident.event_id, e)
+            return False
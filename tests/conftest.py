@@ -0,0 +1,73 @@
+"""
+Shared pytest fixtures.
+"""
+
+import json
+import logging
+import os
+import pytest
+
+_LOG = logging.getLogger(__name__)
+
+
+def pytest_configure(config):
+    """Pin each pytest-xdist worker to one GPU (SUNNY_OSPREY_TEST_GPUS sets the GPU count)."""
+    worker = os.environ.get("PYTEST_XDIST_WORKER")  # e.g. "gw2"
+    if worker and "CUDA_VISIBLE_DEVICES" not in os.environ:
+        gpu_count = max(1, int(os.environ.get("SUNNY_OSPREY_TEST_GPUS", "1")))
+        os.environ["CUDA_VISIBLE_DEVICES"] = str(int(worker[2:]) % gpu_count)
+
+
+@pytest.fixture(scope="session")
+def llm_engine():
+    """Create LLM inference engine for testing using the main prompt.txt file."""
+    from sunny_osprey.llm_inference import LLMInferenceEngine
+    
+    prompt_file = "prompt.txt"  # Use the main project prompt file
+    _LOG.debug("Creating LLM engine fixture (cwd: %s, prompt file exists: %s)",
+               os.getcwd(), os.path.exists(prompt_file))
+    engine = LLMInferenceEngine(prompt_file=prompt_file)
+    # Don't initialize the model here - let individual tests do it when needed
+    yield engine
+
+
+@pytest.fixture(scope="session")
+def inference_results(llm_engine):
+    """Run inference at most once per video and share the result across tests."""
+    results = {}
+    
+    def get(video_path):
+        if video_path not in results:
+            results[video_path] = llm_engine.run_inference(video_path)
+        return results[video_path]
+    
+    return get
+
+
+@pytest.fixture(scope="session")
+def llm_engine_unit():
+    """Create LLM inference engine for unit tests (model loading disabled)."""
+    from sunny_osprey.llm_inference import LLMInferenceEngine
+    
+    prompt_file = "prompt.txt"
+    engine = LLMInferenceEngine(prompt_file=prompt_file)
+    # Unit tests must never load the real model, even by accident
+    engine._initialize_model = lambda: None
+    yield engine
+
+
+@pytest.fixture(scope="session")
+def end_payload():
+    """Encoded Frigate 'end' event as published on frigate/events."""
+    return json.dumps({"type": "end", "after": {"id": "test-id"}}).encode()
+
+
+@pytest.fixture(scope="session")
+def default_processor_kwargs():
+    """FrigateEventProcessor arguments run_mqtt_processor derives from the default config."""
+    return {
+        "mqtt_host": "mqtt",
+        "mqtt_port": 1883,
+        "api_base_url": "http://frigate:5000",
+        "prompt_file": "/app/prompt.txt",
+    }
@@ -0,0 +1,53 @@
+"""
+Tests for the alert manager module.
+"""
+
+import pytest
+from unittest.mock import AsyncMock, Mock
+from telegram import Bot
+from sunny_osprey.alert_manager import AlertManager
+from sunny_osprey.telegram_alert import TelegramAlert
+
+
+@pytest.fixture
+def telegram_config(monkeypatch):
+    """Alerts config selecting the Telegram backend."""
+    monkeypatch.setattr("sunny_osprey.alert_manager._env_snapshot",
+                        lambda: Mock(backend='telegram', video_clip_base_url=None))
+    return {'alerts': {'telegram': {'bot_token': 'test-token', 'chat_id': '12345'}}}
+
+
+class TestAlertManager:
+    """Test cases for the AlertManager class."""
+
+    def test_shared_backend_closed_by_last_owner(self, telegram_config):
+        """Test that a shared backend stays open until every AlertManager using it is closed."""
+        first = AlertManager(telegram_config)
+        second = AlertManager(telegram_config)
+        assert first.alert_backend is second.alert_backend
+        assert isinstance(first.alert_backend, TelegramAlert)
+
+        first.close()
+        assert not second.alert_backend._closed
+
+        second.close()
+        assert second.alert_backend._closed
+
+    def test_rebuilt_manager_can_send_after_close(self, telegram_config, tmp_path):
+        """Test that an AlertManager built after another one closed gets a working backend."""
+        AlertManager(telegram_config).close()
+
+        manager = AlertManager(telegram_config)
+        try:
+            assert not manager.alert_backend._closed
+            bot = Mock(spec=Bot)
+            bot.send_video.return_value = Mock(message_id=1)
+            manager.alert_backend._get_bot = AsyncMock(return_value=bot)
+            clip = tmp_path / "clip.mp4"
+            clip.write_bytes(b"fake video content")
+
+            assert manager.send_incident("event-id", {"suspicious": "yes", "description": "test"},
+                                         video_path=str(clip))
+            bot.send_video.assert_awaited_once()
+        finally:
+            manager.close()
@@ -9,6 +9,23 @@ import yaml
 from sunny_osprey.config import SunnyOspreyConfig
 
 
+# Prefer the libyaml-backed dumper when available
+try:
+    from yaml import CSafeDumper as _Dumper
+except ImportError:
+    from yaml import SafeDumper as _Dumper
+
+
+@pytest.fixture(scope="session")
+def config_factory(tmp_path_factory):
+    """Write config data to a YAML file and load it with SunnyOspreyConfig."""
+    def make(config_data):
+        config_path = tmp_path_factory.mktemp("cfg") / "config.yaml"
+        config_path.write_text(yaml.dump(config_data, Dumper=_Dumper))
+        return SunnyOspreyConfig(str(config_path))
+    return make
+
+
 class TestSunnyOspreyConfig:
     """Test cases for SunnyOspreyConfig class."""
     
@@ -22,7 +39,7 @@ class TestSunnyOspreyConfig:
         assert config.get_frigate_api_url() == "http://frigate:5000"
         assert config.get_prompt_file() == "/app/prompt.txt"
     
-    def test_load_config_from_file(self):
+    def test_load_config_from_file(self, config_factory):
         """Test loading configuration from a YAML file."""
         config_data = {
             'mqtt': {
@@ -40,25 +57,17 @@ class TestSunnyOspreyConfig:
             }
         }
         
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.yaml', delete=False) as f:
-            yaml.dump(config_data, f)
-            config_path = f.name
+        config = config_factory(config_data)
         
-        try:
-            config = SunnyOspreyConfig(config_path)
-            
-            assert config.get_mqtt_host() == "test-mqtt"
-            assert config.get_mqtt_port() == 1884
-            assert config.get_frigate_api_url() == "http://test-frigate:5001"
-            assert config.get_prompt_file() == "/test/prompt.txt"
-            
-            # Test camera filtering
-            assert config.should_process_camera("LPR") == True
-            assert config.should_process_camera("FRONT_DOOR") == True
-            assert config.should_process_camera("BACKYARD") == False
-            
-        finally:
-            os.unlink(config_path)
+        assert config.get_mqtt_host() == "test-mqtt"
+        assert config.get_mqtt_port() == 1884
+        assert config.get_frigate_api_url() == "http://test-frigate:5001"
+        assert config.get_prompt_file() == "/test/prompt.txt"
+        
+        # Test camera filtering
+        assert config.should_process_camera("LPR") == True
+        assert config.should_process_camera("FRONT_DOOR") == True
+        assert config.should_process_camera("BACKYARD") == False
     
     def test_camera_filtering(self):
         """Test camera filtering functionality."""
@@ -68,21 +77,13 @@ class TestSunnyOspreyConfig:
             }
         }
         
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.yaml', delete=False) as f:
-            yaml.dump(config_data, f)
-            config_path = f.name
+        config = SunnyOspreyConfig.from_mapping(config_data)
         
-        try:
-            config = SunnyOspreyConfig(config_path)
-            
-            # Test specific cameras
-            assert config.should_process_camera("LPR") == True
-            assert config.should_process_camera("FRONT_DOOR") == True
-            assert config.should_process_camera("BACKYARD") == False
-            assert config.should_process_camera("GARAGE") == False
-            
-        finally:
-            os.unlink(config_path)
+        # Test specific cameras
+        assert config.should_process_camera("LPR") == True
+        assert config.should_process_camera("FRONT_DOOR") == True
+        assert config.should_process_camera("BACKYARD") == False
+        assert config.should_process_camera("GARAGE") == False
     
     def test_all_cameras_when_none_specified(self):
         """Test that all cameras are processed when none are specified."""
@@ -92,21 +93,13 @@ class TestSunnyOspreyConfig:
             }
         }
         
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.yaml', delete=False) as f:
-            yaml.dump(config_data, f)
-            config_path = f.name
+        config = SunnyOspreyConfig.from_mapping(config_data)
         
-        try:
-            config = SunnyOspreyConfig(config_path)
-            
-            # All cameras should be processed
-            assert config.should_process_camera("LPR") == True
-            assert config.should_process_camera("FRONT_DOOR") == True
-            assert config.should_process_camera("BACKYARD") == True
-            assert config.should_process_camera("ANY_CAMERA") == True
-            
-        finally:
-            os.unlink(config_path)
+        # All cameras should be processed
+        assert config.should_process_camera("LPR") == True
+        assert config.should_process_camera("FRONT_DOOR") == True
+        assert config.should_process_camera("BACKYARD") == True
+        assert config.should_process_camera("ANY_CAMERA") == True
     
     def test_event_filtering(self):
         """Test event filtering based on configuration."""
@@ -116,28 +109,55 @@ class TestSunnyOspreyConfig:
             }
         }
         
+        config = SunnyOspreyConfig.from_mapping(config_data)
+        
+        # Test event that should be processed
+        good_event = {
+            'camera': 'LPR',
+            'label': 'person',
+            'score': 0.8
+        }
+        assert config.should_skip_event(good_event) == False
+        
+        # Test event from wrong camera
+        wrong_camera_event = {
+            'camera': 'BACKYARD',
+            'label': 'person',
+            'score': 0.8
+        }
+        assert config.should_skip_event(wrong_camera_event) == True
+    
+    def test_reload_picks_up_file_changes(self):
+        """Test that reload re-reads the file after it is modified."""
         with tempfile.NamedTemporaryFile(mode='w', suffix='.yaml', delete=False) as f:
-            yaml.dump(config_data, f)
+            yaml.dump({'mqtt': {'host': 'first-mqtt'}}, f, Dumper=_Dumper)
             config_path = f.name
         
         try:
             config = SunnyOspreyConfig(config_path)
+            assert config.get_mqtt_host() == "first-mqtt"
             
-            # Test event that should be processed
-            good_event = {
-                'camera': 'LPR',
-                'label': 'person',
-                'score': 0.8
-            }
-            assert config.should_skip_event(good_event) == False
+            with open(config_path, 'w') as f:
+                yaml.dump({'mqtt': {'host': 'second-mqtt'}}, f, Dumper=_Dumper)
+            # Bump mtime explicitly in case the filesystem timestamp is coarse
+            stat = os.stat(config_path)
+            os.utime(config_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
             
-            # Test event from wrong camera
-            wrong_camera_event = {
-                'camera': 'BACKYARD',
-                'label': 'person',
-                'score': 0.8
-            }
-            assert config.should_skip_event(wrong_camera_event) == True
+            config.reload()
+            assert config.get_mqtt_host() == "second-mqtt"
             
         finally:
-            os.unlink(config_path) 
\ No newline at end of file
+            os.unlink(config_path)
+    
+    def test_reload_keeps_mapping_config(self):
+        """Test that reload() leaves a configuration built from a mapping unchanged."""
+        config = SunnyOspreyConfig.from_mapping({
+            'mqtt': {'host': 'mapped-mqtt'},
+            'cameras': {'enabled_cameras': ['LPR']}
+        })
+        
+        config.reload()
+        
+        assert config.get_mqtt_host() == "mapped-mqtt"
+        assert config.should_process_camera("LPR") == True
+        assert config.should_process_camera("BACKYARD") == False
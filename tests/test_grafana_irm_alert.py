@@ -0,0 +1,66 @@
+"""
+Tests for the Grafana IRM alert module.
+"""
+
+import time
+import pytest
+from unittest.mock import Mock
+from sunny_osprey.grafana_irm_alert import GrafanaIRMAlert
+from sunny_osprey.incident import Incident
+
+
+def _incident(event_id):
+    """Suspicious incident for the given event."""
+    return Incident(
+        event_id=event_id, description="test", title_description="test",
+        video_url="", is_suspicious=True, llm_result={"suspicious": "yes"}, video_path=None
+    )
+
+
+@pytest.fixture
+def grafana_config():
+    """Enabled Grafana IRM config."""
+    return {'url': 'http://grafana.invalid', 'api_key': 'test-key'}
+
+
+class TestGrafanaIRMAlert:
+    """Test cases for the GrafanaIRMAlert class."""
+
+    def test_send_is_synchronous_by_default(self, grafana_config):
+        """Test that send_incident reports the outcome of the post itself by default."""
+        alert = GrafanaIRMAlert(grafana_config)
+        alert._create_irm_incident = Mock(return_value=False)
+
+        assert alert.send_incident(_incident("event-1")) is False
+        alert._create_irm_incident.assert_called_once()
+        assert alert._worker is None
+
+    def test_close_posts_queued_incidents(self, grafana_config):
+        """Test that close() waits for queued incidents to be posted and stops the worker."""
+        alert = GrafanaIRMAlert(dict(grafana_config, async_send=True))
+        posted = []
+
+        def create(payload):
+            time.sleep(0.02)
+            posted.append(payload['title'])
+            return True
+
+        alert._create_irm_incident = Mock(side_effect=create)
+        for i in range(5):
+            assert alert.send_incident(_incident("event-%s" % i))
+        worker = alert._worker
+
+        alert.close()
+
+        assert len(posted) == 5
+        assert not worker.is_alive()
+
+    def test_send_after_close_posts_inline(self, grafana_config):
+        """Test that an incident sent after close() is posted rather than queued for a stopped worker."""
+        alert = GrafanaIRMAlert(dict(grafana_config, async_send=True))
+        alert._create_irm_incident = Mock(return_value=True)
+        alert.close()
+
+        assert alert.send_incident(_incident("late-event"))
+        alert._create_irm_incident.assert_called_once()
+        assert alert._worker is None
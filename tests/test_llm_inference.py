@@ -6,11 +6,23 @@ import json
 import os
 import pytest
 import tempfile
+from functools import lru_cache
 from pathlib import Path
 from typing import Dict, Any, Optional
 from unittest.mock import patch, Mock
 
-from sunny_osprey.llm_inference import LLMInferenceEngine
+from sunny_osprey.llm_inference import LLMInferenceEngine, _extract_top_level_json
+
+
+# String values (case-insensitive) that count as "suspicious"
+_TRUTHY = frozenset(("yes", "true", "1"))
+
+_TYPE_DISPATCH = {
+    bool: lambda v: v,
+    str: lambda v: v.lower() in _TRUTHY,
+    int: bool,
+    float: bool,
+}
 
 
 def is_suspicious_activity_detected(llm_result: Dict[str, Any]) -> bool:
@@ -27,54 +39,47 @@ def is_suspicious_activity_detected(llm_result: Dict[str, Any]) -> bool:
         bool: True if suspicious activity detected, False otherwise
     """
     # Check for new field name first, then fall back to old field name
-    value = llm_result.get('suspicious') or llm_result.get('is_unusual_or_suspicious_activity_detected')
+    value = llm_result['suspicious'] if 'suspicious' in llm_result else llm_result.get('is_unusual_or_suspicious_activity_detected')
     
-    # Handle None/empty values
-    if value is None:
+    # Dispatch on the exact type; None and any other type (lists, dicts, ...) are False
+    normalize = _TYPE_DISPATCH.get(type(value))
+    return bool(normalize(value)) if normalize else False
+
+
+# Diagnostic output is opt-in so it stays out of the timed test bodies
+_VERBOSE = bool(os.environ.get("SUNNY_OSPREY_VERBOSE"))
+
+
+def _vprint(*args, **kwargs):
+    """Print only when SUNNY_OSPREY_VERBOSE is set."""
+    if _VERBOSE:
+        print(*args, **kwargs)
+
+
+@lru_cache(maxsize=1)
+def _check_internet_connectivity() -> bool:
+    """Check (once per session) if internet connectivity is available for Hugging Face model downloads."""
+    # Let offline CI skip the network round trip entirely
+    if os.environ.get("SUNNY_OSPREY_OFFLINE"):
+        return False
+    try:
+        import requests
+        response = requests.get("https://huggingface.co", timeout=5)
+        return response.status_code == 200
+    except Exception:
         return False
-    
-    # Handle boolean values
-    if isinstance(value, bool):
-        return value
-    
-    # Handle string values (case-insensitive)
-    if isinstance(value, str):
-        return value.lower() in ["yes", "true", "1"]
-    
-    # Handle numeric values
-    if isinstance(value, (int, float)):
-        return bool(value)
-    
-    # Default to False for any other type
-    return False
+
+
+@lru_cache(maxsize=None)
+def _video_exists(video_path: str) -> bool:
+    """Check (once per path) if a test video file exists."""
+    return os.path.exists(video_path)
 
 
 class TestLLMInference:
     """Test cases for LLM inference engine using pytest."""
     
-    @pytest.fixture(scope="class")
-    def llm_engine(self):
-        """Create LLM inference engine for testing using the main prompt.txt file."""
-        print(f"\n🧠 Initializing LLM engine fixture")
-        print(f"📁 Current working directory: {os.getcwd()}")
-        print(f"📄 Prompt file path: prompt.txt")
-        print(f"📄 Prompt file exists: {os.path.exists('prompt.txt')}")
-        
-        prompt_file = "prompt.txt"  # Use the main project prompt file
-        engine = LLMInferenceEngine(prompt_file=prompt_file)
-        # Don't initialize the model here - let individual tests do it when needed
-        print(f"✅ LLM engine created successfully (model not loaded yet)")
-        yield engine
-    
-    @pytest.fixture(scope="class")
-    def llm_engine_unit(self):
-        """Create LLM inference engine for unit tests (no model loading)."""
-        prompt_file = "prompt.txt"
-        engine = LLMInferenceEngine(prompt_file=prompt_file)
-        # Don't initialize the model for unit tests
-        yield engine
-    
-    @pytest.fixture
+    @pytest.fixture(scope="session")
     def test_videos(self):
         """Provide test video paths."""
         return {
@@ -86,24 +91,16 @@ class TestLLMInference:
             "package": "/app/test_videos/package.mp4"
         }
     
-    def _check_internet_connectivity(self):
-        """Check if internet connectivity is available for Hugging Face model downloads."""
-        try:
-            import requests
-            response = requests.get("https://huggingface.co", timeout=5)
-            return response.status_code == 200
-        except Exception:
-            return False
-    
     def _check_video_exists(self, video_path: str) -> bool:
         """Check if test video file exists."""
-        print(f"🔍 Checking if video exists: {video_path}")
-        print(f"📁 Current working directory: {os.getcwd()}")
-        print(f"📁 Video file exists: {os.path.exists(video_path)}")
-        if not os.path.exists(video_path):
-            print(f"❌ Video file not found: {video_path}")
+        exists = _video_exists(video_path)
+        _vprint(f"🔍 Checking if video exists: {video_path}")
+        _vprint(f"📁 Current working directory: {os.getcwd()}")
+        _vprint(f"📁 Video file exists: {exists}")
+        if not exists:
+            _vprint(f"❌ Video file not found: {video_path}")
             pytest.skip(f"Test video file not found: {video_path}")
-        print(f"✅ Video file found: {video_path}")
+        _vprint(f"✅ Video file found: {video_path}")
         return True
     
     def _validate_result_structure(self, result: Optional[Dict[str, Any]]) -> None:
@@ -132,29 +129,30 @@ class TestLLMInference:
     
     @pytest.mark.slow
     @pytest.mark.llm
-    def test_criminal_video_detects_suspicious_activity(self, llm_engine, test_videos):
+    @pytest.mark.xdist_group("llm_gpu0")
+    def test_criminal_video_detects_suspicious_activity(self, inference_results, test_videos):
         """Test that criminal.mp4 correctly detects suspicious activity."""
-        print(f"\n🚀 Starting test_criminal_video_detects_suspicious_activity")
-        print(f"📋 Available test videos: {list(test_videos.keys())}")
+        _vprint(f"\n🚀 Starting test_criminal_video_detects_suspicious_activity")
+        _vprint(f"📋 Available test videos: {list(test_videos.keys())}")
         
         # Check internet connectivity for model downloads
-        if not self._check_internet_connectivity():
+        if not _check_internet_connectivity():
             pytest.skip("No internet connectivity available for Hugging Face model downloads")
         
         video_path = test_videos["criminal"]
-        print(f"🎬 Using video path: {video_path}")
+        _vprint(f"🎬 Using video path: {video_path}")
         
         self._check_video_exists(video_path)
         
-        print(f"\n🔍 Testing criminal video: {video_path}")
-        print("📹 Extracting frames and running LLM inference...")
+        _vprint(f"\n🔍 Testing criminal video: {video_path}")
+        _vprint("📹 Extracting frames and running LLM inference...")
         
         try:
-            result = llm_engine.run_inference(video_path)
+            result = inference_results(video_path)
             
             # Check for errors first
             if "error" in result:
-                print(f"❌ LLM inference failed: {result['error']}")
+                _vprint(f"❌ LLM inference failed: {result['error']}")
                 pytest.skip(f"LLM inference failed: {result['error']}")
             
             # Validate result structure
@@ -162,47 +160,49 @@ class TestLLMInference:
             
             # Verify suspicious activity is detected (case-insensitive)
             is_suspicious = self._is_suspicious_activity_detected(result)
-            print(f"🎯 Suspicious activity detected: {is_suspicious}")
+            _vprint(f"🎯 Suspicious activity detected: {is_suspicious}")
             assert is_suspicious, \
                 "Criminal video should be detected as suspicious activity"
             
             # Verify description is not empty
             has_description = self._has_description(result)
-            print(f"📝 Has description: {has_description}")
+            _vprint(f"📝 Has description: {has_description}")
             assert has_description, \
                 "Description should not be empty for suspicious activity"
             
-            print(f"✅ Criminal video test result: {json.dumps(result, indent=2)}")
+            if _VERBOSE:
+                print(f"✅ Criminal video test result: {json.dumps(result, indent=2)}")
             
         except Exception as e:
-            print(f"❌ Test failed due to error: {e}")
+            _vprint(f"❌ Test failed due to error: {e}")
             pytest.skip(f"Test failed due to error: {e}")
     
     @pytest.mark.slow
     @pytest.mark.llm
-    def test_gate_static_video_detects_no_suspicious_activity(self, llm_engine, test_videos):
+    @pytest.mark.xdist_group("llm_gpu0")
+    def test_gate_static_video_detects_no_suspicious_activity(self, inference_results, test_videos):
         """Test that gate-static.mp4 correctly detects no suspicious activity."""
         # Check internet connectivity for model downloads
-        if not self._check_internet_connectivity():
+        if not _check_internet_connectivity():
             pytest.skip("No internet connectivity available for Hugging Face model downloads")
         
         video_path = test_videos["gate_static"]
         self._check_video_exists(video_path)
         
-        print(f"\n🔍 Testing gate static video: {video_path}")
-        print("📹 Extracting frames and running LLM inference...")
+        _vprint(f"\n🔍 Testing gate static video: {video_path}")
+        _vprint("📹 Extracting frames and running LLM inference...")
         
         try:
-            result = llm_engine.run_inference(video_path)
+            result = inference_results(video_path)
             
             # Check for errors first
             if "error" in result:
                 # If it's a memory error, skip the test
                 if "out of memory" in result["error"].lower():
-                    print(f"❌ CUDA out of memory: {result['error']}")
+                    _vprint(f"❌ CUDA out of memory: {result['error']}")
                     pytest.skip(f"CUDA out of memory: {result['error']}")
                 else:
-                    print(f"❌ LLM inference failed: {result['error']}")
+                    _vprint(f"❌ LLM inference failed: {result['error']}")
                     pytest.skip(f"LLM inference failed: {result['error']}")
             
             # Validate result structure
@@ -210,19 +210,20 @@ class TestLLMInference:
             
             # Verify no suspicious activity is detected (case-insensitive)
             is_suspicious = self._is_suspicious_activity_detected(result)
-            print(f"🎯 Suspicious activity detected: {is_suspicious}")
+            _vprint(f"🎯 Suspicious activity detected: {is_suspicious}")
             assert not is_suspicious, \
                 "Gate static video should not be detected as suspicious activity"
             
             # Allow any description (including non-empty) for non-suspicious activity
             has_description = self._has_description(result)
-            print(f"📝 Has description: {has_description}")
+            _vprint(f"📝 Has description: {has_description}")
             # No assertion on description content for non-suspicious activity
             
-            print(f"✅ Gate static video test result: {json.dumps(result, indent=2)}")
+            if _VERBOSE:
+                print(f"✅ Gate static video test result: {json.dumps(result, indent=2)}")
             
         except Exception as e:
-            print(f"❌ Test failed due to error: {e}")
+            _vprint(f"❌ Test failed due to error: {e}")
             pytest.skip(f"Test failed due to error: {e}")
     
     @pytest.mark.parametrize("video_name,expected_suspicious", [
@@ -235,17 +236,18 @@ class TestLLMInference:
     ])
     @pytest.mark.slow
     @pytest.mark.llm
-    def test_video_classification(self, llm_engine, test_videos, video_name, expected_suspicious):
+    @pytest.mark.xdist_group("llm_gpu0")
+    def test_video_classification(self, inference_results, test_videos, video_name, expected_suspicious):
         """Parametrized test for video classification."""
         # Check internet connectivity for model downloads
-        if not self._check_internet_connectivity():
+        if not _check_internet_connectivity():
             pytest.skip("No internet connectivity available for Hugging Face model downloads")
         
         video_path = test_videos[video_name]
         self._check_video_exists(video_path)
         
         try:
-            result = llm_engine.run_inference(video_path)
+            result = inference_results(video_path)
             
             # Check for errors
             if "error" in result:
@@ -262,11 +264,13 @@ class TestLLMInference:
             assert is_suspicious == expected_suspicious, \
                 f"{video_name} should be classified as {'suspicious' if expected_suspicious else 'non-suspicious'}"
             
-            print(f"✅ {video_name} test result: {json.dumps(result, indent=2)}")
+            if _VERBOSE:
+                print(f"✅ {video_name} test result: {json.dumps(result, indent=2)}")
             
         except Exception as e:
             pytest.skip(f"Test failed due to error: {e}")
     
+    @pytest.mark.xdist_group("unit")
     def test_invalid_video_path(self, llm_engine_unit):
         """Test handling of invalid video path."""
         result = llm_engine_unit.run_inference("nonexistent_video.mp4")
@@ -275,6 +279,7 @@ class TestLLMInference:
         assert result is None or "error" in result, \
             "Should handle invalid video path gracefully"
     
+    @pytest.mark.xdist_group("unit")
     def test_frame_extraction(self, llm_engine_unit, test_videos):
         """Test frame extraction functionality."""
         video_path = test_videos["criminal"]
@@ -292,6 +297,7 @@ class TestLLMInference:
             assert isinstance(timestamp, (int, float)), "Timestamp should be numeric"
     
     @pytest.mark.unit
+    @pytest.mark.xdist_group("unit")
     def test_model_initialization(self, llm_engine_unit):
         """Test model initialization (lazy loading)."""
         # Create a fresh engine instance for this test to ensure model is None initially
@@ -324,6 +330,7 @@ class TestLLMInference:
             mock_model.assert_called_once()
     
     @pytest.mark.unit
+    @pytest.mark.xdist_group("unit")
     def test_json_response_parsing(self, llm_engine_unit):
         """Test JSON response parsing functionality."""
         # Test valid JSON extraction
@@ -347,6 +354,54 @@ class TestLLMInference:
             llm_engine_unit.run_inference = original_run_inference
     
     @pytest.mark.unit
+    @pytest.mark.xdist_group("unit")
+    def test_extract_top_level_json(self):
+        """Test brace-matching JSON extraction from raw LLM text."""
+        response = 'Analysis: {"suspicious": "no", "description": "sign reads \\"}{\\"", "meta": {"n": 1}} done }'
+        json_str = _extract_top_level_json(response)
+        assert json.loads(json_str) == {"suspicious": "no", "description": 'sign reads "}{"', "meta": {"n": 1}}
+        
+        assert _extract_top_level_json("stray } before {\"a\": 1}") == '{"a": 1}'
+        assert _extract_top_level_json("no json here") is None
+        assert _extract_top_level_json('{"unterminated": 1') is None
+    
+    @pytest.mark.unit
+    @pytest.mark.xdist_group("unit")
+    def test_compile_failure_falls_back_to_eager(self, llm_engine_unit):
+        """Test that a torch.compile error restores the eager decoder instead of failing."""
+        model = Mock()
+        eager_decoder = model.get_decoder.return_value
+        
+        with patch('sunny_osprey.llm_inference.torch.cuda.is_available', return_value=True), \
+             patch('sunny_osprey.llm_inference.torch.compile', side_effect=RuntimeError("inductor error")):
+            llm_engine_unit._compile_model(model)
+        
+        model.set_decoder.assert_called_once_with(eager_decoder)
+        model.generate.assert_not_called()
+    
+    @pytest.mark.unit
+    @pytest.mark.xdist_group("unit")
+    def test_reload_prompts(self):
+        """Test that prompt files are read once and re-read on reload_prompts()."""
+        with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as f:
+            f.write("original prompt")
+            prompt_path = f.name
+        try:
+            engine = LLMInferenceEngine(prompt_file=prompt_path)
+            assert engine._get_prompt_messages()[1]["content"][0]["text"] == "original prompt"
+            
+            with open(prompt_path, "w") as f:
+                f.write("edited prompt")
+            # Cached until explicitly reloaded
+            assert engine._get_prompt_messages()[1]["content"][0]["text"] == "original prompt"
+            
+            engine.reload_prompts()
+            assert engine._get_prompt_messages()[1]["content"][0]["text"] == "edited prompt"
+        finally:
+            os.unlink(prompt_path)
+    
+    @pytest.mark.unit
+    @pytest.mark.xdist_group("unit")
     def test_suspicious_activity_detection_logic(self):
         """Test the suspicious activity detection logic with various input types."""
         # Test new field name "suspicious"
@@ -391,9 +446,7 @@ class TestLLMInference:
             "suspicious": True,
             "is_unusual_or_suspicious_activity_detected": False
         })
-        # Note: The current implementation uses OR logic, so if either field is True, it returns True
-        # This test reflects the actual behavior of the function
-        assert is_suspicious_activity_detected({
+        assert not is_suspicious_activity_detected({
             "suspicious": False,
             "is_unusual_or_suspicious_activity_detected": True
         })
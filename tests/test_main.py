@@ -2,6 +2,7 @@
 Tests for the main module.
 """
 
+import sys
 import pytest
 from sunny_osprey.main import run_mqtt_processor, parse_arguments
 
@@ -9,54 +10,40 @@ from sunny_osprey.main import run_mqtt_processor, parse_arguments
 class TestParseArguments:
     """Test cases for the parse_arguments function."""
     
-    def test_parse_arguments_defaults(self):
-        """Test parse_arguments with default values."""
-        # Mock sys.argv to avoid actual command line parsing
-        import sys
-        original_argv = sys.argv
-        sys.argv = ['test_main.py']
-        
-        try:
-            args = parse_arguments()
-            assert args.config == '/app/sunny-osprey-config.yaml'
-        finally:
-            sys.argv = original_argv
-    
-    def test_parse_arguments_custom_values(self):
-        """Test parse_arguments with custom values."""
-        import sys
-        original_argv = sys.argv
-        sys.argv = [
-            'test_main.py',
-            '--config', '/custom/config.yaml'
-        ]
-        
-        try:
-            args = parse_arguments()
-            assert args.config == '/custom/config.yaml'
-        finally:
-            sys.argv = original_argv
+    @pytest.mark.parametrize("argv,expected", [
+        ([], {'config': '/app/sunny-osprey-config.yaml'}),
+        (['--config', '/custom/config.yaml'], {'config': '/custom/config.yaml'}),
+    ])
+    def test_parse_arguments(self, argv, expected):
+        """Test parse_arguments with default and custom values."""
+        args = parse_arguments(argv)
+        for name, value in expected.items():
+            assert getattr(args, name) == value
 
 
 class TestRunMqttProcessor:
     """Test cases for the run_mqtt_processor function."""
     
-    def test_run_mqtt_processor_initialization(self):
+    def test_run_mqtt_processor_initialization(self, default_processor_kwargs):
         """Test that run_mqtt_processor can be called without errors."""
         # Mock the FrigateEventProcessor and LLMInferenceEngine to avoid actual connections
         from unittest.mock import patch, Mock, ANY
+        from sunny_osprey.mqtt_processor import FrigateEventProcessor
         
-        with patch('sunny_osprey.llm_inference.LLMInferenceEngine') as mock_llm_class, \
-             patch('sunny_osprey.mqtt_processor.FrigateEventProcessor') as mock_processor_class:
+        # Stand in for the whole llm_inference module so run_mqtt_processor's
+        # import never loads torch/transformers
+        mock_llm_class = Mock()
+        with patch.dict(sys.modules, {'sunny_osprey.llm_inference': Mock(LLMInferenceEngine=mock_llm_class)}), \
+             patch('sunny_osprey.mqtt_processor.FrigateEventProcessor') as mock_processor_class, \
+             patch('sunny_osprey.main.time.sleep'):
             
-            # Mock the LLM engine instance
-            mock_llm_engine = Mock()
+            # Mock the LLM engine instance; a name spec avoids importing the real class
+            mock_llm_engine = Mock(spec=["_initialize_model"])
             mock_llm_class.return_value = mock_llm_engine
             
             # Mock the processor instance and its start method to raise KeyboardInterrupt to break the while loop
-            mock_processor = Mock()
-            mock_processor.start = Mock(side_effect=KeyboardInterrupt("Test interrupt to break loop"))
-            mock_processor.stop = Mock()
+            mock_processor = Mock(spec=FrigateEventProcessor)
+            mock_processor.start.side_effect = KeyboardInterrupt("Test interrupt to break loop")
             mock_processor_class.return_value = mock_processor
             
             # Call the function with test parameters
@@ -68,10 +55,7 @@ class TestRunMqttProcessor:
             
             # Verify that FrigateEventProcessor was called with correct parameters
             mock_processor_class.assert_called_once_with(
-                mqtt_host="mqtt",  # Default from config
-                mqtt_port=1883,    # Default from config
-                api_base_url="http://frigate:5000",  # Default from config
-                prompt_file="/app/prompt.txt",  # Default from config
+                **default_processor_kwargs,  # Defaults from config
                 llm_engine=mock_llm_engine,
                 config=ANY  # Accept any config object
             )
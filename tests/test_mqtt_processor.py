@@ -2,12 +2,58 @@
 Tests for the MQTT processor module.
 """
 
+import errno
+import io
 import pytest
 import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+import paho.mqtt.client as mqtt
 from unittest.mock import Mock, patch, MagicMock
 from sunny_osprey.mqtt_processor import FrigateEventProcessor
 
 
+# Encoded non-end MQTT payloads; the end payload is the end_payload fixture
+NEW_PAYLOAD = json.dumps({"type": "new", "after": {"id": "test-id"}}).encode()
+UPDATE_PAYLOAD = json.dumps({"type": "update", "after": {"id": "test-id"}}).encode()
+# Passes the '"type": "end"' byte prefilter but is not an end event
+NESTED_END_PAYLOAD = json.dumps({"type": "update", "after": {"id": "test-id", "type": "end"}}).encode()
+MALFORMED_PAYLOAD = b'{"type": "end", "after": '
+
+
+def _frigate_message(payload):
+    """Build a real paho message as delivered on the frigate/events topic."""
+    msg = mqtt.MQTTMessage(topic=b"frigate/events")
+    msg.payload = payload
+    return msg
+
+
+@pytest.fixture(scope="module", autouse=True)
+def _no_network():
+    """Fail fast on any HTTP request a test forgot to mock."""
+    def send(adapter, request, **kwargs):
+        raise requests.exceptions.ConnectionError("Network access disabled in tests: %s" % request.url)
+    
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(HTTPAdapter, "send", send)
+        yield
+
+
+@pytest.fixture(scope="module")
+def processor():
+    """Shared processor for tests that leave its state unchanged."""
+    processor = FrigateEventProcessor()
+    yield processor
+    processor._executor.shutdown(wait=True)
+    processor._alert_executor.shutdown(wait=True)
+
+
 class TestFrigateEventProcessor:
     """Test cases for the FrigateEventProcessor class."""
     
@@ -19,10 +65,8 @@ class TestFrigateEventProcessor:
         assert processor.api_base_url == "http://127.0.0.1:5000"
         assert processor.prompt_file == "prompt.txt"  # Default value from __init__
     
-    def test_extract_event_id(self):
+    def test_extract_event_id(self, processor):
         """Test event ID extraction from MQTT payload."""
-        processor = FrigateEventProcessor()
-        
         # Test valid event data
         event_data = {
             "after": {
@@ -34,55 +78,291 @@ class TestFrigateEventProcessor:
         event_id = event_data.get("after", {}).get("id")
         assert event_id == "1752239252.709833-lt9sy7"
     
-    def test_filter_end_events(self):
+    def test_filter_end_events(self, processor, end_payload):
         """Test that only 'end' events are processed."""
-        processor = FrigateEventProcessor()
-        
         # Mock message handler
         with patch.object(processor, '_process_end_event') as mock_process:
-            # Test end event
-            end_event = {"type": "end", "after": {"id": "test-id"}}
-            processor._on_message(None, None, Mock(payload=json.dumps(end_event).encode()))
-            mock_process.assert_called_once()
+            # End events are processed on a worker thread
+            processed = threading.Event()
+            mock_process.side_effect = lambda event_data: processed.set()
             
-            # Test non-end event
-            mock_process.reset_mock()
-            start_event = {"type": "start", "after": {"id": "test-id"}}
-            processor._on_message(None, None, Mock(payload=json.dumps(start_event).encode()))
+            processor._on_message(None, None, _frigate_message(end_payload))
+            assert processed.wait(timeout=5)
+            mock_process.assert_called_once()
+    
+    @pytest.mark.parametrize("payload", [
+        NEW_PAYLOAD, UPDATE_PAYLOAD, NESTED_END_PAYLOAD, MALFORMED_PAYLOAD
+    ])
+    def test_non_end_events_not_processed(self, processor, payload):
+        """Test that non-end and malformed payloads are never submitted."""
+        with patch.object(processor, '_submit_end_event') as mock_submit:
+            processor._on_message(None, None, _frigate_message(payload))
+            mock_submit.assert_not_called()
+    
+    def test_end_event_dropped_when_queue_full(self, end_payload):
+        """Test that end events are dropped instead of queued without bound."""
+        processor = FrigateEventProcessor()
+        processor._pending_events = threading.BoundedSemaphore(1)
+        processor._pending_events.acquire()
+        
+        with patch.object(processor, '_process_end_event') as mock_process:
+            processor._on_message(None, None, _frigate_message(end_payload))
+            processor._executor.shutdown(wait=True)
             mock_process.assert_not_called()
     
-    @patch('requests.get')
-    @patch('os.path.getsize')
-    @patch('tempfile.NamedTemporaryFile')
-    def test_download_video_clip_success(self, mock_temp, mock_getsize, mock_get):
-        """Test successful video clip download."""
+    def test_stop_cancels_queued_events(self, end_payload):
+        """Test that stop() cancels queued events and frees their queue slots."""
         processor = FrigateEventProcessor()
+        processor.mqtt_client = Mock()
+        release = threading.Event()
+        started = []
+        
+        def block(event_data):
+            started.append(event_data)
+            release.wait(timeout=5)
+        
+        with patch.object(processor, '_process_end_event', side_effect=block):
+            for _ in range(5):
+                processor._on_message(None, None, _frigate_message(end_payload))
+            processor.stop()
+            release.set()
+            processor._executor.shutdown(wait=True)
+        
+        # Only the two running events were processed; the three queued ones were cancelled
+        assert len(started) == 2
+        assert processor._pending_events._value == processor._pending_events._initial_value
+    
+    def test_running_event_skips_inference_after_stop(self, tmp_path):
+        """Test that an event still running when stop() is called skips inference and removes its clip."""
+        clip = tmp_path / "clip.mp4"
+        clip.write_bytes(b"fake video content")
+        processor = FrigateEventProcessor(llm_engine=Mock())
+        
+        def download_then_stop(event_id, event_data):
+            # stop() arrives while the clip is downloading
+            processor._stopping.set()
+            return str(clip)
+        
+        with patch.object(processor, '_download_video_clip', side_effect=download_then_stop):
+            processor._process_end_event({"type": "end", "after": {"id": "stop-id"}})
+        
+        processor.llm_engine.run_inference.assert_not_called()
+        assert not clip.exists()
+        # Not recorded as seen, so the event is processed after a restart re-emits it
+        assert processor._mark_event_seen("stop-id")
+    
+    def test_duplicate_end_event_skipped(self, tmp_path):
+        """Test that a re-emitted end event is not downloaded twice once it was processed."""
+        clip = tmp_path / "clip.mp4"
+        clip.write_bytes(b"fake video content")
+        llm_engine = Mock()
+        llm_engine.run_inference.return_value = {"suspicious": "no", "description": "test"}
+        processor = FrigateEventProcessor(llm_engine=llm_engine)
+        end_event = {"type": "end", "after": {"id": "dup-id"}}
+        
+        with patch.object(processor, '_download_video_clip', return_value=str(clip)) as mock_download, \
+             patch.object(processor, '_submit_alert'):
+            processor._process_end_event(end_event)
+            processor._process_end_event(end_event)
+            mock_download.assert_called_once()
+    
+    def test_failed_event_retried_when_reemitted(self, tmp_path):
+        """Test that an event whose download failed is processed when Frigate re-emits it."""
+        clip = tmp_path / "clip.mp4"
+        clip.write_bytes(b"fake video content")
+        llm_engine = Mock()
+        llm_engine.run_inference.return_value = {"suspicious": "no", "description": "test"}
+        processor = FrigateEventProcessor(llm_engine=llm_engine)
+        end_event = {"type": "end", "after": {"id": "retry-id"}}
         
-        # Mock successful response
-        mock_response = Mock()
-        mock_response.raise_for_status.return_value = None
-        mock_response.content = b"fake video content"
-        mock_get.return_value = mock_response
+        with patch.object(processor, '_download_video_clip', side_effect=[None, str(clip)]) as mock_download, \
+             patch.object(processor, '_submit_alert') as mock_submit:
+            processor._process_end_event(end_event)
+            mock_submit.assert_not_called()
+            
+            processor._process_end_event(end_event)
+            assert mock_download.call_count == 2
+            mock_submit.assert_called_once()
+            assert mock_submit.call_args.args[0] == "retry-id"
+    
+    def test_event_retried_after_inference_error(self, tmp_path):
+        """Test that an inference error releases the event ID and removes the clip."""
+        clip = tmp_path / "clip.mp4"
+        clip.write_bytes(b"fake video content")
+        llm_engine = Mock()
+        llm_engine.run_inference.side_effect = RuntimeError("CUDA out of memory")
+        processor = FrigateEventProcessor(llm_engine=llm_engine)
+        
+        with patch.object(processor, '_download_video_clip', return_value=str(clip)):
+            processor._process_end_event({"type": "end", "after": {"id": "error-id"}})
+        
+        assert not clip.exists()
+        assert processor._mark_event_seen("error-id")
+    
+    def test_alert_sent_from_alert_pool_then_clip_removed(self, tmp_path):
+        """Test that alerts run on the alert pool and the clip is removed afterwards."""
+        clip = tmp_path / "clip.mp4"
+        clip.write_bytes(b"fake video content")
+        
+        llm_engine = Mock()
+        llm_engine.run_inference.return_value = {"suspicious": "yes", "description": "test"}
+        processor = FrigateEventProcessor(llm_engine=llm_engine)
+        processor.alert_manager.send_incident = Mock(return_value=True)
         
-        # Mock file size check (non-zero file)
-        mock_getsize.return_value = 1024
+        with patch.object(processor, '_download_video_clip', return_value=str(clip)):
+            processor._process_end_event({"type": "end", "after": {"id": "alert-id"}})
+        processor._alert_executor.shutdown(wait=True)
+        
+        processor.alert_manager.send_incident.assert_called_once()
+        assert processor.alert_manager.send_incident.call_args.args[0] == "alert-id"
+        assert not clip.exists()
+    
+    def test_download_retried_when_body_read_fails(self, processor, monkeypatch, tmp_path):
+        """Test that an error while streaming the clip body is retried and leaves no partial file."""
+        monkeypatch.setattr(processor, "_clip_tmp_dir", str(tmp_path))
+        monkeypatch.setattr("sunny_osprey.mqtt_processor.time.sleep", lambda seconds: None)
         
-        # Mock temporary file
-        mock_temp_file = Mock()
-        mock_temp_file.name = "/tmp/test.mp4"
-        mock_temp_file.write = Mock()
-        mock_temp.return_value.__enter__.return_value = mock_temp_file
+        class ResetBody(io.BytesIO):
+            def read(self, *args):
+                raise urllib3.exceptions.ProtocolError("Connection reset by peer")
+        
+        def response(body):
+            streamed = MagicMock()
+            streamed.__enter__.return_value.raw = body
+            return streamed
+        
+        mock_get = MagicMock(side_effect=[response(ResetBody(b"partial")), response(io.BytesIO(b"fake video content"))])
+        monkeypatch.setattr(processor._http, "get", mock_get)
         
         result = processor._download_video_clip("test-event-id")
-        assert result == "/tmp/test.mp4"
+        
+        assert mock_get.call_count == 2
+        with open(result, "rb") as f:
+            assert f.read() == b"fake video content"
+        assert [p.name for p in tmp_path.iterdir()] == [os.path.basename(result)]
     
-    @patch('requests.get')
-    def test_download_video_clip_failure(self, mock_get):
-        """Test video clip download failure."""
-        processor = FrigateEventProcessor()
+    def test_download_falls_back_when_clip_dir_is_full(self, processor, monkeypatch, tmp_path):
+        """Test that a full clip temp dir (e.g. a small /dev/shm) falls back to the system temp dir."""
+        shm_dir = tmp_path / "shm"
+        system_tmp = tmp_path / "tmp"
+        shm_dir.mkdir()
+        system_tmp.mkdir()
+        monkeypatch.setattr(processor, "_clip_tmp_dir", str(shm_dir))
+        monkeypatch.setattr(tempfile, "tempdir", str(system_tmp))
+        
+        mock_get = MagicMock()
+        monkeypatch.setattr(processor._http, "get", mock_get)
+        mock_response = MagicMock()
+        type(mock_response).raw = property(lambda self: io.BytesIO(b"fake video content"))
+        mock_get.return_value.__enter__.return_value = mock_response
+        
+        real_copyfileobj = shutil.copyfileobj
+        
+        def copyfileobj(src, dst, length=0):
+            if dst.name.startswith(str(shm_dir)):
+                raise OSError(errno.ENOSPC, "No space left on device")
+            real_copyfileobj(src, dst, length)
+        
+        monkeypatch.setattr("sunny_osprey.mqtt_processor.shutil.copyfileobj", copyfileobj)
+        
+        result = processor._download_video_clip("test-event-id")
+        assert result.startswith(str(system_tmp))
+        with open(result, "rb") as f:
+            assert f.read() == b"fake video content"
+        # The partial clip in the full directory was removed
+        assert list(shm_dir.iterdir()) == []
+    
+    def test_stop_drains_alerts_before_closing_backends(self, tmp_path):
+        """Test that stop() lets queued alerts finish before closing the alert backends."""
+        processor = FrigateEventProcessor(llm_engine=Mock())
+        processor.mqtt_client = Mock()
+        calls = []
+        
+        def send_incident(event_id, result, video_path=None):
+            time.sleep(0.05)
+            calls.append(event_id)
+            return True
+        
+        processor.alert_manager.send_incident = Mock(side_effect=send_incident)
+        processor.alert_manager.close = Mock(side_effect=lambda: calls.append("close"))
+        
+        for i in range(4):
+            clip = tmp_path / ("clip%s.mp4" % i)
+            clip.write_bytes(b"fake video content")
+            processor._submit_alert("alert-%s" % i, {"suspicious": "no"}, str(clip))
+        processor.stop()
+        
+        assert calls[-1] == "close"
+        assert sorted(calls[:-1]) == ["alert-0", "alert-1", "alert-2", "alert-3"]
+        assert list(tmp_path.iterdir()) == []
+    
+    def test_stop_cancels_alerts_left_after_drain_timeout(self, tmp_path):
+        """Test that alerts still queued after the drain timeout are cancelled and their clips removed."""
+        processor = FrigateEventProcessor(llm_engine=Mock())
+        processor.mqtt_client = Mock()
+        processor._alert_drain_timeout = 0.1
+        release = threading.Event()
+        processor.alert_manager.send_incident = Mock(side_effect=lambda *args, **kwargs: release.wait(timeout=5))
+        
+        clips = []
+        for i in range(3):
+            clip = tmp_path / ("clip%s.mp4" % i)
+            clip.write_bytes(b"fake video content")
+            clips.append(clip)
+            processor._submit_alert("alert-%s" % i, {"suspicious": "no"}, str(clip))
+        processor.stop()
+        
+        # Both alert workers were busy, so the third alert never started
+        assert not clips[2].exists()
+        release.set()
+        processor._alert_executor.shutdown(wait=True)
+        assert processor.alert_manager.send_incident.call_count == 2
+        assert list(tmp_path.iterdir()) == []
+        assert processor._pending_alerts._value == processor._pending_alerts._initial_value
+    
+    def test_alert_dropped_after_stop(self, tmp_path):
+        """Test that an alert submitted after stop() is dropped instead of sent to closed backends."""
+        clip = tmp_path / "clip.mp4"
+        clip.write_bytes(b"fake video content")
+        processor = FrigateEventProcessor(llm_engine=Mock())
+        processor.mqtt_client = Mock()
+        processor.stop()
+        processor.alert_manager.send_incident = Mock()
+        
+        processor._submit_alert("late-id", {"suspicious": "no"}, str(clip))
+        
+        processor.alert_manager.send_incident.assert_not_called()
+        assert not clip.exists()
+    
+    @pytest.mark.parametrize("content,get_error,status_error,expected_content", [
+        pytest.param(b"fake video content", None, None, b"fake video content", id="success"),
+        pytest.param(None, requests.exceptions.ConnectionError("Network error"), None, None, id="network_error"),
+        pytest.param(None, None, requests.exceptions.HTTPError("404 Not Found"), None, id="http_error"),
+        pytest.param(b"", None, None, None, id="zero_size"),
+    ])
+    def test_download_video_clip(self, processor, monkeypatch, tmp_path,
+                                 content, get_error, status_error, expected_content):
+        """Test video clip download outcomes."""
+        mock_get = MagicMock(side_effect=get_error)
+        monkeypatch.setattr(processor._http, "get", mock_get)
+        monkeypatch.setattr(processor, "_clip_tmp_dir", str(tmp_path))
+        # Skip the wait before retrying an empty clip
+        monkeypatch.setattr("sunny_osprey.mqtt_processor.time.sleep", lambda seconds: None)
         
-        # Mock failed response
-        mock_get.side_effect = Exception("Network error")
+        # Mock streamed response; each attempt gets a fresh body
+        mock_response = MagicMock()
+        mock_response.raise_for_status.side_effect = status_error
+        type(mock_response).raw = property(lambda self: io.BytesIO(content))
+        mock_get.return_value.__enter__.return_value = mock_response
         
         result = processor._download_video_clip("test-event-id")
-        assert result is None
+        if expected_content is None:
+            assert result is None
+            # Every failure mode gets all three attempts
+            assert mock_get.call_count == 3
+            # Failed and empty downloads leave no files behind
+            assert list(tmp_path.iterdir()) == []
+        else:
+            with open(result, "rb") as f:
+                assert f.read() == expected_content
+            assert mock_get.call_args.kwargs["stream"] is True
@@ -0,0 +1,162 @@
+"""
+Tests for the Telegram alert module.
+"""
+
+import asyncio
+import concurrent.futures
+import threading
+import time
+import pytest
+from unittest.mock import AsyncMock, Mock
+from telegram import Bot
+from telegram.error import BadRequest, Conflict, Forbidden, InvalidToken, RetryAfter, TimedOut
+from sunny_osprey.incident import Incident
+from sunny_osprey.telegram_alert import TelegramAlert, TELEGRAM_CAPTION_LIMIT
+
+
+@pytest.fixture
+def telegram_alert():
+    """Configured TelegramAlert whose event loop is torn down after the test."""
+    alert = TelegramAlert({'bot_token': 'test-token', 'chat_id': '12345'})
+    yield alert
+    alert.close()
+
+
+@pytest.fixture
+def mock_bot(telegram_alert, monkeypatch):
+    """Specced Bot mock served by the alert's _get_bot."""
+    bot = Mock(spec=Bot)
+    monkeypatch.setattr(telegram_alert, "_get_bot", AsyncMock(return_value=bot))
+    return bot
+
+
+@pytest.fixture
+def video_path(tmp_path):
+    """Small clip file to upload."""
+    path = tmp_path / "clip.mp4"
+    path.write_bytes(b"fake video content")
+    return str(path)
+
+
+def _incident(description, video_path):
+    """Incident with the given description and clip."""
+    return Incident(
+        event_id="test-event", description=description, title_description=description[:100],
+        video_url="", is_suspicious=True, llm_result={"suspicious": "yes"}, video_path=video_path
+    )
+
+
+class TestTelegramAlert:
+    """Test cases for the TelegramAlert class."""
+
+    def test_close_unblocks_pending_send(self, telegram_alert):
+        """Test that close() cancels a send in progress instead of leaving its caller blocked."""
+        started = threading.Event()
+        errors = []
+
+        async def slow_send():
+            started.set()
+            await asyncio.sleep(30)
+
+        def caller():
+            try:
+                telegram_alert._run(slow_send())
+            except Exception as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=caller)
+        thread.start()
+        assert started.wait(timeout=5)
+
+        start_time = time.perf_counter()
+        telegram_alert.close()
+        thread.join(timeout=5)
+
+        assert not thread.is_alive()
+        assert time.perf_counter() - start_time < 5
+        assert isinstance(errors[0], concurrent.futures.CancelledError)
+
+    def test_no_sends_after_close(self, telegram_alert):
+        """Test that close() does not let a later send start a new event loop."""
+        telegram_alert._ensure_loop()
+        telegram_alert.close()
+
+        with pytest.raises(RuntimeError):
+            telegram_alert._ensure_loop()
+        assert telegram_alert._loop is None
+
+    @pytest.mark.parametrize("error", [
+        BadRequest("File too large"), Forbidden("Bot was blocked"), InvalidToken("Invalid token"),
+        Conflict("Terminated by other getUpdates request"), TypeError("unexpected keyword argument"),
+    ])
+    def test_send_video_permanent_error_not_retried(self, telegram_alert, mock_bot, video_path, monkeypatch, error):
+        """Test that permanent and unexpected errors are raised after a single attempt."""
+        sleep = AsyncMock()
+        monkeypatch.setattr(asyncio, "sleep", sleep)
+        mock_bot.send_video.side_effect = error
+
+        with pytest.raises(type(error)):
+            asyncio.run(telegram_alert._send_telegram_video(video_path, "caption"))
+
+        assert mock_bot.send_video.call_count == 1
+        sleep.assert_not_called()
+
+    def test_send_video_transient_error_retried(self, telegram_alert, mock_bot, video_path, monkeypatch):
+        """Test that transient errors are retried with backoff and raised after the last attempt."""
+        sleep = AsyncMock()
+        monkeypatch.setattr(asyncio, "sleep", sleep)
+        mock_bot.send_video.side_effect = TimedOut()
+
+        with pytest.raises(TimedOut):
+            asyncio.run(telegram_alert._send_telegram_video(video_path, "caption"))
+
+        assert mock_bot.send_video.call_count == 3
+        # Backoff between attempts only: about 1 s, then about 2 s, each plus up to 1 s of jitter
+        delays = [call.args[0] for call in sleep.await_args_list]
+        assert len(delays) == 2
+        assert 1 <= delays[0] < 2 and 2 <= delays[1] < 3
+        assert mock_bot.send_video.call_args.kwargs["video"] == b"fake video content"
+        assert mock_bot.send_video.call_args.kwargs["filename"] == "clip.mp4"
+
+    def test_send_video_waits_retry_after_on_flood_control(self, telegram_alert, mock_bot, video_path, monkeypatch):
+        """Test that flood control waits the interval Telegram asks for, then retries."""
+        sleep = AsyncMock()
+        monkeypatch.setattr(asyncio, "sleep", sleep)
+        message = Mock(message_id=7)
+        mock_bot.send_video.side_effect = [RetryAfter(17), message]
+
+        assert asyncio.run(telegram_alert._send_telegram_video(video_path, "caption")) is message
+
+        assert mock_bot.send_video.call_count == 2
+        sleep.assert_awaited_once_with(17)
+
+    def test_long_description_overflow_sent_as_reply(self, telegram_alert, mock_bot, video_path):
+        """Test that text past the caption limit is sent as a reply to the video message."""
+        description = "a" * TELEGRAM_CAPTION_LIMIT + "overflow text"
+        mock_bot.send_video.return_value = Mock(message_id=42)
+
+        assert telegram_alert.send_incident(_incident(description, video_path))
+
+        assert mock_bot.send_video.call_args.kwargs["caption"] == "a" * TELEGRAM_CAPTION_LIMIT
+        mock_bot.send_message.assert_awaited_once_with(
+            text="overflow text", chat_id="12345", reply_to_message_id=42
+        )
+
+    def test_short_description_sent_as_caption_only(self, telegram_alert, mock_bot, video_path):
+        """Test that a description within the caption limit needs no follow-up message."""
+        mock_bot.send_video.return_value = Mock(message_id=42)
+
+        assert telegram_alert.send_incident(_incident("short description", video_path))
+
+        assert mock_bot.send_video.call_args.kwargs["caption"] == "short description"
+        mock_bot.send_message.assert_not_called()
+
+    def test_overflow_skipped_without_video_message(self, telegram_alert, mock_bot, video_path):
+        """Test that no reply is attempted when the video send returns no message."""
+        description = "a" * TELEGRAM_CAPTION_LIMIT + "overflow text"
+        mock_bot.send_video.return_value = None
+
+        assert telegram_alert.send_incident(_incident(description, video_path))
+
+        assert mock_bot.send_video.call_args.kwargs["caption"] == "a" * TELEGRAM_CAPTION_LIMIT
+        mock_bot.send_message.assert_not_called()